@@ -0,0 +1,76 @@
+"""
+Compares the interwiki prefix index with a linear scan over the prefix table.
+
+Usage (from the repository root):
+    python -m benchmarks.interwiki_prefixes
+"""
+
+import random
+import timeit
+from typing import Dict, List, Optional
+
+from cogs.wikilinks.prefixes import PREFIXES, PrefixCallable, PrefixIndex, wiki_link
+
+SIZES = (20, 200, 2000)
+
+
+def make_prefixes(size: int) -> Dict[str, PrefixCallable]:
+    prefixes = dict(PREFIXES)
+    n = 0
+    while len(prefixes) < size:
+        prefixes[f"iw{n}"] = wiki_link(f"https://iw{n}.example.org/wiki/{{page}}")
+        prefixes[f"iw{n}:ru"] = wiki_link(f"https://ru.iw{n}.example.org/wiki/{{page}}")
+        n += 1
+    return prefixes
+
+
+def make_targets(prefixes: Dict[str, PrefixCallable], count: int = 1000) -> List[str]:
+    rng = random.Random(0)
+    names = list(prefixes)
+    targets = []
+    for i in range(count):
+        choice = rng.random()
+        if choice < 0.5:
+            targets.append(f"Page {i}")  # no prefix at all, the most common case
+        elif choice < 0.7:
+            targets.append(f"Help:Page {i}")  # namespace, not a prefix
+        else:
+            # w:c expects a wiki before the page name, other prefixes don't care
+            targets.append(f"{rng.choice(names)}:ru.community:Page {i}")
+    return targets
+
+
+def linear_scan(prefixes: Dict[str, PrefixCallable], target: str) -> Optional[str]:
+    """How Link.make_url used to look prefixes up."""
+    for prefix, func in prefixes.items():
+        if target.startswith(prefix + ":"):
+            return func(target[len(prefix) + 1:])
+    return None
+
+
+def indexed(index: PrefixIndex, target: str) -> Optional[str]:
+    resolved = index.resolve(target)
+    if resolved is None:
+        return None
+    func, page = resolved
+    return func(page)
+
+
+def main() -> None:
+    for size in SIZES:
+        prefixes = make_prefixes(size)
+        index = PrefixIndex(prefixes)
+        targets = make_targets(prefixes)
+
+        for name, func in (
+            ("linear scan", lambda target: linear_scan(prefixes, target)),
+            ("prefix index", lambda target: indexed(index, target)),
+        ):
+            timer = timeit.Timer(lambda: [func(target) for target in targets])
+            runs, total = timer.autorange()
+            per_link = total / runs / len(targets)
+            print(f"{len(prefixes):>5} prefixes, {name:>12}: {per_link * 1e9:10.1f} ns/link")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Compares the guild repository with the way GuildSettings used to build its queries.
+
+The first part only measures the Python side and needs no database. The second
+part talks to the Postgres server configured through the usual PG* environment
+variables, if there is one, and runs everything inside a transaction that is
+rolled back at the end.
+
+Usage (from the repository root):
+    python -m benchmarks.settings_repository
+"""
+
+import asyncio
+import random
+import time
+import timeit
+from dataclasses import asdict, dataclass, InitVar
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from utils.flags import GuildFlags
+from utils.repository import EDITABLE_COLUMNS, GuildRepository
+
+GUILDS = 1000
+
+
+@dataclass
+class OldSettings:
+    """The fields of GuildSettings before the repository, with a stand-in for the bot."""
+    id: int
+    prefix: str
+
+    bot: InitVar[Any]
+
+    bound_wiki_url: Optional[str] = None
+    bound_wiki_name: Optional[str] = None
+
+    flags: Optional[GuildFlags] = None
+
+    def __post_init__(self, bot):
+        self._bot = bot
+
+
+def old_update_query(settings: OldSettings, **kwargs: Any) -> Tuple[str, List[Any]]:
+    """How GuildSettings.update used to build the statement."""
+    query = "UPDATE wh_guilds SET "
+    fields = asdict(settings).keys()
+    for idx, field in enumerate(kwargs.keys()):
+        if field not in fields:
+            raise ValueError("Invalid parameter passed: " + field)
+
+        query += f"{field}=${idx + 1} "
+    query += f"WHERE id=${len(kwargs) + 1}"
+    return query, [*kwargs.values(), settings.id]
+
+
+def random_changes(rng: random.Random, count: int) -> List[Dict[str, Any]]:
+    changes = []
+    for _ in range(count):
+        columns = rng.sample(EDITABLE_COLUMNS, rng.randint(1, len(EDITABLE_COLUMNS)))
+        values: Dict[str, Any] = {}
+        for column in columns:
+            values[column] = rng.randint(0, 7) if column == "flags" else f"value {rng.random()}"
+        changes.append(values)
+    return changes
+
+
+def bench_python() -> None:
+    rng = random.Random(0)
+    changes = random_changes(rng, 1000)
+    settings = OldSettings(id=1, prefix="!", bot=object())
+
+    def old() -> None:
+        for values in changes:
+            old_update_query(settings, **values)
+
+    def new() -> None:
+        for values in changes:
+            GuildRepository.validate(values, editable=True)
+
+    for name, func in (("f-string + asdict", old), ("fixed statement", new)):
+        runs, total = timeit.Timer(func).autorange()
+        print(f"{name:>18}: {total / runs / len(changes) * 1e9:8.1f} ns/update, python only")
+
+    distinct = {old_update_query(settings, **values)[0] for values in changes}
+    print(f"{len(distinct)} distinct UPDATE statements before, 1 after")
+
+
+async def bench_database(conn: asyncpg.Connection) -> None:
+    rng = random.Random(0)
+    ids = [10 ** 17 + i for i in range(GUILDS)]
+    changes = random_changes(rng, GUILDS)
+
+    class Pool:
+        """Lets the repository use the connection holding the transaction."""
+        def acquire(self):
+            return self
+
+        async def __aenter__(self):
+            return conn
+
+        async def __aexit__(self, *exc):
+            pass
+
+    repository = GuildRepository(Pool())  # type: ignore
+
+    tr = conn.transaction()
+    await tr.start()
+    try:
+        await repository.create_many(ids)
+
+        started = time.perf_counter()
+        for guild_id in ids:
+            await conn.fetchrow("SELECT * FROM wh_guilds WHERE id=$1", guild_id)
+        print(f"{'row by row':>18}: {(time.perf_counter() - started) * 1000:8.1f} ms to read {GUILDS} guilds")
+
+        started = time.perf_counter()
+        await repository.fetch_many(ids)
+        print(f"{'fetch_many':>18}: {(time.perf_counter() - started) * 1000:8.1f} ms to read {GUILDS} guilds")
+
+        settings = OldSettings(id=0, prefix="!", bot=object())
+        started = time.perf_counter()
+        for guild_id, values in zip(ids, changes):
+            settings.id = guild_id
+            query, args = old_update_query(settings, **values)
+            await conn.execute(query, *args)
+        print(f"{'f-string updates':>18}: {(time.perf_counter() - started) * 1000:8.1f} ms for {GUILDS} guilds")
+
+        started = time.perf_counter()
+        for guild_id, values in zip(ids, changes):
+            await repository.update(guild_id, **values)
+        print(f"{'repository.update':>18}: {(time.perf_counter() - started) * 1000:8.1f} ms for {GUILDS} guilds")
+
+        started = time.perf_counter()
+        await repository.update_many(dict(zip(ids, changes)))
+        print(f"{'update_many':>18}: {(time.perf_counter() - started) * 1000:8.1f} ms for {GUILDS} guilds")
+    finally:
+        await tr.rollback()
+
+
+async def main() -> None:
+    bench_python()
+
+    try:
+        conn = await asyncpg.connect()
+    except (OSError, asyncpg.PostgresError) as exc:
+        print(f"Skipping the database part: {exc}")
+        return
+
+    try:
+        await bench_database(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
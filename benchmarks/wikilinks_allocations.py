@@ -0,0 +1,150 @@
+"""
+Measures memory and time spent on the objects on_message creates for a message with wikilinks.
+
+Every message gets a GuildSettings object and a Link per wikilink, and while a
+message waits in the send queue all of them stay alive. The old, dict-based
+versions of these classes are kept here for comparison.
+
+Usage (from the repository root):
+    python -m benchmarks.wikilinks_allocations
+"""
+
+import random
+import string
+import timeit
+import tracemalloc
+from dataclasses import dataclass, InitVar
+from typing import Any, Callable, List, Match, Optional
+
+from cogs.wikilinks.link import Link
+from cogs.wikilinks.parser import find_wikilink_matches, substitute
+from cogs.wikilinks.prefixes import INTERWIKI, PrefixIndex
+from utils.flags import GuildFlags
+from utils.settings import GuildSettings, SettingsCache
+from utils.wiki import Wiki
+
+MESSAGES = 2000
+
+
+class OldLink:
+    """Link before it was slotted, with the URL computed in the constructor."""
+
+    def __init__(self, match: Match[str], wiki: Wiki, prefixes: PrefixIndex = INTERWIKI) -> None:
+        self.target: str = match.group(1)
+        self.title: Optional[str] = match.group(2)
+
+        if self.title == "":
+            self.title = self.target.split(":")[-1]
+        if self.title is None:
+            self.title = self.target
+        ending = match.group(3) or ""
+        self.title += ending
+
+        self.wiki = wiki
+        self.prefixes = prefixes
+        self.original = match.group(0)
+        self.start, self.end = match.span(0)
+        self.is_interwiki = False
+        self.exists: Optional[bool] = None
+        self.url = self.make_url()
+
+    def make_url(self) -> str:
+        resolved = self.prefixes.resolve(self.target)
+        if resolved is not None:
+            func, page = resolved
+            self.is_interwiki = True
+            return func(page)
+
+        return self.wiki.url_to(self.target)
+
+    def to_hyperlink(self) -> str:
+        return f"[{self.title}](<{self.url}>)"
+
+
+class OldFlags:
+    def __init__(self, value: int = 0):
+        self.value = value
+
+
+@dataclass
+class OldSettings:
+    id: int
+    prefix: str
+
+    bot: InitVar[Any]
+
+    bound_wiki_url: Optional[str] = None
+    bound_wiki_name: Optional[str] = None
+
+    flags: Optional[OldFlags] = None
+
+    def __post_init__(self, bot):
+        self._bot = bot
+        self._repository = bot.guild_repository
+        self._cache = bot.settings_cache
+
+
+class FakeBot:
+    prefixes = {}
+    guild_repository = None
+    settings_cache: SettingsCache = SettingsCache(maxsize=1)
+
+
+def make_corpus(size: int) -> List[str]:
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(300)]
+    corpus = []
+    for _ in range(size):
+        parts = rng.choices(words, k=rng.randint(3, 20))
+        for _ in range(rng.randint(1, 4)):
+            target = rng.choice(words).title()
+            if rng.random() < 0.2:
+                target = "w:c:ru.community:" + target
+            parts.insert(rng.randrange(len(parts) + 1), f"[[{target}]]")
+        corpus.append(" ".join(parts))
+    return corpus
+
+
+def handle(
+    content: str,
+    link_cls: Callable[..., Any],
+    settings_cls: Callable[..., Any],
+    flags_cls: Callable[[int], Any],
+    wiki: Wiki,
+    bot: FakeBot
+) -> Any:
+    """The allocating part of on_message, returns what a queued job keeps alive."""
+    settings = settings_cls(id=1, prefix="!", bot=bot)
+    settings.flags = flags_cls(3)
+    links = [link_cls(match, wiki=wiki) for match in find_wikilink_matches(content)]
+    new_content = substitute(content, ((link.start, link.end, link.to_hyperlink()) for link in links))
+    return settings, links, new_content
+
+
+def main() -> None:
+    corpus = make_corpus(MESSAGES)
+    wiki = Wiki(url="https://community.fandom.com/ru", id=None)
+    bot = FakeBot()
+
+    for name, link_cls, settings_cls, flags_cls in (
+        ("dict-based", OldLink, OldSettings, OldFlags),
+        ("slotted", Link, GuildSettings, GuildFlags),
+    ):
+        tracemalloc.start()
+        jobs = [handle(content, link_cls, settings_cls, flags_cls, wiki, bot) for content in corpus]
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        links = sum(len(job[1]) for job in jobs)
+        del jobs
+
+        timer = timeit.Timer(lambda: [handle(content, link_cls, settings_cls, flags_cls, wiki, bot) for content in corpus])
+        runs, total = timer.autorange()
+        print(
+            f"{name:>10}: {current / MESSAGES:7.0f} B/message retained, {peak / MESSAGES:7.0f} B/message peak, "
+            f"{total / runs / MESSAGES * 1e6:6.2f} us/message ({links / MESSAGES:.1f} links/message)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures how much the wikilinks listener spends on messages without links.
+
+Usage (from the repository root):
+    python -m benchmarks.wikilinks_prefilter [corpus.jsonl]
+
+The corpus is a file with one JSON-encoded message content per line. When it
+is not given, a synthetic corpus is generated instead.
+"""
+
+import json
+import random
+import string
+import sys
+import timeit
+from typing import List
+
+from cogs.wikilinks.parser import (
+    CODEBLOCK_REGEX,
+    WIKILINK_REGEX,
+    find_wikilink_matches,
+    has_wikilink_candidates,
+)
+
+
+def load_corpus(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_corpus(size: int = 10000, linked_ratio: float = 0.01) -> List[str]:
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(500)]
+
+    corpus = []
+    for _ in range(size):
+        message = " ".join(rng.choices(words, k=rng.randint(1, 40)))
+        if rng.random() < 0.05:
+            message += " ```py\n" + " ".join(rng.choices(words, k=20)) + "\n```"
+        if rng.random() < linked_ratio:
+            message += f" [[{rng.choice(words)}|{rng.choice(words)}]]"
+        corpus.append(message)
+
+    return corpus
+
+
+def regex_scan(text: str) -> bool:
+    """The work the listener used to do for every message before bailing out."""
+    CODEBLOCK_REGEX.findall(text)
+    return bool(WIKILINK_REGEX.findall(text))
+
+
+def main() -> None:
+    corpus = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else synthetic_corpus()
+    link_free = [message for message in corpus if not find_wikilink_matches(message)]
+    print(f"{len(corpus)} messages, {len(link_free)} without wikilinks")
+
+    for name, func in (
+        ("substring gate", has_wikilink_candidates),
+        ("regex scan", regex_scan),
+        ("gate + matches", find_wikilink_matches),
+    ):
+        timer = timeit.Timer(lambda: [func(message) for message in link_free])
+        runs, total = timer.autorange()
+        per_message = total / runs / max(len(link_free), 1)
+        print(f"{name:>16}: {per_message * 1e9:8.1f} ns/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,61 @@
-from typing import Dict
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Mapping, Optional
 import aiohttp
 import discord
 from discord.ext import commands
 import asyncpg
 
 from config import config
+from utils.autocomplete import AutocompleteEngine
+from utils.cache import ResponseCache
+from utils.client import WikiClient
 from utils.context import WhiteContext
+from utils.directory import WikiDirectory
 from utils.errors import MissingRequiredFlag
+from utils.metrics import LoopLagMonitor, MetricsServer, TimedPool, registry
+from utils.notifications import SettingsListener
+from utils.profiler import LoopProfiler
+from utils.repository import GuildRepository
+from utils.settings import SettingsCache
+from utils.startup import StartupTimer
+from utils.sync import CommandSync, ScopeDiff
+
+log = logging.getLogger(__name__)
 
 def _prefix_callable(bot, msg):
     if not msg.guild:
         prefix = config.default_prefix
     else:
-        prefix = bot.prefixes[msg.guild.id]
+        # The guild might not be reconciled yet if we have just connected
+        prefix = bot.prefixes.get(msg.guild.id, config.default_prefix)
 
     return commands.when_mentioned_or(prefix)(bot, msg)
 
-class Bot(commands.Bot):
+class Bot(commands.AutoShardedBot):
     pool: asyncpg.Pool
+    guild_repository: GuildRepository
     prefixes: Dict[int, str]
+    settings_cache: SettingsCache
+    wiki_client: WikiClient
+    autocomplete: AutocompleteEngine
+    wiki_directory: WikiDirectory
+    settings_listener: SettingsListener
+    loop_lag_monitor: LoopLagMonitor
+    metrics_server: Optional[MetricsServer]
+    profiler: LoopProfiler
 
-    def __init__(self):
+    def __init__(
+        self,
+        *,
+        shard_ids: Optional[List[int]] = None,
+        shard_count: Optional[int] = None,
+        cluster_id: int = 0,
+        cluster_count: int = 1
+    ):
+        self.cluster_id = cluster_id
+        self.cluster_count = cluster_count
         intents = discord.Intents(
             guilds=True,
             messages=True,
@@ -41,49 +76,233 @@ class Bot(commands.Bot):
             intents=intents,
             allowed_mentions=allowed_mentions,
             description=config.description,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+        )
+        self.settings_cache = SettingsCache(
+            maxsize=config.settings_cache.max_size,
+            ttl=config.settings_cache.ttl
         )
+        self.autocomplete = AutocompleteEngine.from_config(config.autocomplete)
+        self.startup = StartupTimer()
+        self._setup_finished: Optional[float] = None
+        # Cogs that are only loaded when one of their commands is used
+        self.lazy_commands = {
+            command: name for name, commands in config.lazy_cogs.items() for command in commands
+        }
+        self._lazy_lock = asyncio.Lock()
+        self.command_sync = CommandSync(self)
 
-    async def sync(self):
-        if self.guild_ids:
-            for guild_id in self.guild_ids:
-                guild = discord.Object(guild_id)
-                self.tree.copy_global_to(guild=guild)
-                await self.tree.sync(guild=guild)
-        else:
-            await self.tree.sync()
+    async def sync(self, *, dry_run: bool = False, force: bool = False) -> List[ScopeDiff]:
+        """Syncs the application commands of the test guilds in debug mode or the global ones otherwise.
+
+        Scopes whose commands have not changed since the last sync are skipped.
+        """
+        return await self.command_sync.sync(dry_run=dry_run, force=force)
 
     async def setup_hook(self):
-        self.pool = await asyncpg.create_pool() # type: ignore # idk why it's Pool | None
+        startup = self.startup
         self.session = aiohttp.ClientSession()
+        with startup.phase("wiki client"):
+            self.wiki_client = WikiClient.from_config(
+                self.session,
+                config.wiki_client,
+                cache=ResponseCache.from_config(config.wiki_cache)
+            )
 
-        self.prefixes = await self.get_prefixes()
+        self.prefixes = {}
+        self.settings_listener = SettingsListener(self)
+        self.profiler = LoopProfiler.from_config(config.profiler)
+        if config.profiler.enabled:
+            self.profiler.start()
+        self.metrics_server = None
+        if config.metrics.enabled:
+            self.metrics_server = MetricsServer(config.metrics.host, config.metrics.port + self.cluster_id)
 
-        for cog in config.cogs:
-            await self.load_extension(cog)
+        # The listener has a connection of its own, so it does not need to wait for the pool.
+        # It starts before the settings are loaded, so that no change made during loading is missed
+        await startup.gather(
+            ("database", self.create_pool()),
+            ("settings listener", self.settings_listener.start()),
+            *([("metrics server", self.metrics_server.start())] if self.metrics_server is not None else [])
+        )
+        self.guild_repository = GuildRepository(self.pool)
+        self.wiki_directory = WikiDirectory.from_config(self, config.wiki_directory)
+
+        self.register_metrics()
+        self.loop_lag_monitor = LoopLagMonitor(config.metrics.loop_lag_interval)
+        self.loop_lag_monitor.start()
+
+        # Nothing is dispatched before setup_hook returns, so the cogs do not need the settings yet
+        await startup.gather(
+            ("guild settings", self.load_guild_settings()),
+            ("wiki directory", self.wiki_directory.load()),
+            ("cogs", self.load_cogs())
+        )
+        self.wiki_directory.start()
+
+        # Clusters share the commands, one of them is enough to sync
+        if config.command_sync.on_startup and self.cluster_id == 0:
+            try:
+                await startup.run("command sync", self.sync())
+            except discord.HTTPException:
+                log.exception("Failed to sync application commands")
+        self._setup_finished = time.perf_counter()
+
+    async def create_pool(self) -> None:
+        self.pool = TimedPool(await asyncpg.create_pool(
+            min_size=config.pool.min_size,
+            max_size=config.pool.max_size
+        )) # type: ignore # idk why it's Pool | None
+
+    async def load_cogs(self) -> None:
+        """Loads the cogs from the config at the same time, each one timed separately."""
+        await self.startup.gather(*((f"cog {name}", self.load_extension(name)) for name in config.cogs))
+
+    async def load_lazy_cog(self, name: str) -> None:
+        async with self._lazy_lock:
+            # Someone else might have used a command of the cog while we were waiting
+            if name in self.extensions:
+                return
+            started = time.perf_counter()
+            await self.load_extension(name)
+            log.info("Loaded %s on first use in %.1f ms", name, (time.perf_counter() - started) * 1000)
 
     async def close(self, *args, **kwargs):
-        await self.pool.close()
-        await self.session.close()
-        
+        if self.is_closed():
+            return
+
+        # Unloads the cogs first, they might still need the pool and the session
         await super().close(*args, **kwargs)
 
+        # setup_hook might have failed half way, so any of these might be missing
+        metrics_server = getattr(self, "metrics_server", None)
+        if metrics_server is not None:
+            await metrics_server.stop()
+        for name in ("loop_lag_monitor", "profiler", "wiki_directory"):
+            component = getattr(self, name, None)
+            if component is not None:
+                component.stop()
+        settings_listener = getattr(self, "settings_listener", None)
+        if settings_listener is not None:
+            await settings_listener.stop()
+        pool = getattr(self, "pool", None)
+        if pool is not None:
+            await pool.close()
+        session = getattr(self, "session", None)
+        if session is not None:
+            await session.close()
+        wiki_client = getattr(self, "wiki_client", None)
+        if wiki_client is not None and wiki_client.cache is not None:
+            wiki_client.cache.close()
+
     async def get_context(self, origin, cls=WhiteContext) -> WhiteContext:
-        return await super().get_context(origin, cls=cls)
+        ctx = await super().get_context(origin, cls=cls)
+        if ctx.command is None and ctx.invoked_with in self.lazy_commands:
+            await self.load_lazy_cog(self.lazy_commands[ctx.invoked_with])
+            ctx = await super().get_context(origin, cls=cls)
+        return ctx
 
-    async def get_prefixes(self) -> Dict[int, str]:
-        guilds = await self.pool.fetch("SELECT id, prefix FROM wh_guilds")
-        return {
-            g["id"]: g["prefix"]
-            for g in guilds
-        }
+    def register_metrics(self) -> None:
+        """Exposes the counters kept by the bot's caches and clients."""
+        def cache_lookups():
+            values = {
+                ("settings", "hit"): self.settings_cache.hits,
+                ("settings", "miss"): self.settings_cache.misses,
+            }
+            cache = self.wiki_client.cache
+            if cache is not None:
+                values.update({
+                    ("wiki_responses", "hit"): cache.hits,
+                    ("wiki_responses", "stale"): cache.stale_hits,
+                    ("wiki_responses", "miss"): cache.misses,
+                })
+            return values
+
+        registry.callback(
+            "whitespace_cache_lookups_total", "Lookups of in-memory caches", ("cache", "result"),
+            cache_lookups, type="counter"
+        )
+        registry.callback(
+            "whitespace_wiki_client_calls_total",
+            "Calls of WikiClient, coalesced ones shared the request of an identical call",
+            ("kind",),
+            lambda: {("all",): self.wiki_client.requests, ("coalesced",): self.wiki_client.coalesced},
+            type="counter"
+        )
+        registry.callback(
+            "whitespace_autocomplete_unanswered_total",
+            "Autocomplete requests answered without waiting for fresh results",
+            ("reason",),
+            lambda: {("timeout",): self.autocomplete.timeouts, ("superseded",): self.autocomplete.abandoned},
+            type="counter"
+        )
+        registry.callback(
+            "whitespace_pool_connections", "Connections of the database pool", ("state",),
+            lambda: {("open",): self.pool.get_size(), ("idle",): self.pool.get_idle_size()}
+        )
+        registry.callback(
+            "whitespace_loop_blocks_total", "Times the event loop was blocked for longer than the threshold", (),
+            lambda: {(): self.profiler.total_blocks}, type="counter"
+        )
+        registry.callback(
+            "whitespace_startup_phase_seconds", "Time taken by each phase of the startup", ("phase",),
+            lambda: {(name,): duration for name, duration in self.startup.durations.items()}
+        )
+        registry.callback("whitespace_guilds", "Guilds the bot is in", (), lambda: {(): len(self.guilds)})
+        registry.callback(
+            "whitespace_shard_latency_seconds", "Gateway latency of every shard", ("shard",),
+            lambda: {(str(shard_id),): latency for shard_id, latency in self.latencies}
+        )
+
+    def remember_guilds(self, rows: Iterable[Mapping[str, Any]]) -> None:
+        for row in rows:
+            self.prefixes[row["id"]] = row["prefix"]
+            self.settings_cache.set(row["id"], dict(row))
+
+    async def load_guild_settings(self) -> None:
+        """Loads settings of every guild into memory in a single query"""
+        started = time.perf_counter()
+        # Changes committed while the query runs must win over its snapshot
+        self.settings_listener.hold()
+        try:
+            rows = await self.guild_repository.fetch_all()
+            self.remember_guilds(rows)
+        finally:
+            self.settings_listener.release()
+
+        log.info("Loaded settings of %d guilds in %.1f ms", len(rows), (time.perf_counter() - started) * 1000)
+
+    async def reconcile_guilds(self) -> None:
+        """Creates settings for the guilds the bot has joined while it was offline"""
+        missing = [guild.id for guild in self.guilds if guild.id not in self.prefixes]
+        if not missing:
+            return
+
+        started = time.perf_counter()
+        rows = await self.guild_repository.create_many(missing)
+
+        self.remember_guilds(rows)
+        log.info(
+            "Reconciled %d guilds (%d created) in %.1f ms",
+            len(missing), len(rows), (time.perf_counter() - started) * 1000
+        )
 
     async def on_ready(self):
         print('Logged on as {0} (ID: {0.id})'.format(self.user))
+        if self.startup.finished:
+            await self.reconcile_guilds()
+            return
+
+        if self._setup_finished is not None:
+            self.startup.record("gateway", self._setup_finished)
+        await self.startup.run("reconcile guilds", self.reconcile_guilds())
+        self.startup.finish()
 
     async def on_guild_join(self, guild):
-        async with self.pool.acquire() as conn:
-            await conn.execute("INSERT INTO wh_guilds (id) VALUES ($1)", guild.id)
-        self.prefixes[guild.id] = config.default_prefix
+        # The bot might be returning to a guild it has already been in
+        row = await self.guild_repository.ensure(guild.id)
+        self.remember_guilds([row])
     
     async def on_command_error(self, ctx: WhiteContext, error: commands.CommandError) -> None:
         unwrapped = error
@@ -101,7 +320,7 @@ class Bot(commands.Bot):
             raise error
         
 
-bot = Bot()
-
 if __name__ == "__main__":
-    bot.run(config.credentials.token)
+    bot = Bot()
+    # The timings and warnings of the bot's own modules are as useful as those of discord.py
+    bot.run(config.credentials.token, root_logger=True)
@@ -13,21 +13,25 @@ from utils.context import WhiteContext
 
 if TYPE_CHECKING:
     from ..bot import Bot
+    from config import BetaFeaturesStrings
 
 
-strings = _strings.config.beta_features_menu
+def menu_strings() -> "BetaFeaturesStrings":
+    # Looked up every time, so that reloaded strings show up in new menus
+    return _strings.config.beta_features_menu
 
 
 class ManageConfigSelect(ui.Select):
     def __init__(self, context: "WhiteContext"):
         assert context.settings is not None
         self.settings = context.settings
+        self.strings = strings = menu_strings()
         super().__init__(
             options=[
                 discord.SelectOption(
-                    label=feature["name"], 
-                    value=feature["flag_name"],
-                    default=getattr(self.settings.flags, feature["flag_name"])
+                    label=feature.name, 
+                    value=feature.flag_name,
+                    default=getattr(self.settings.flags, feature.flag_name)
                 ) 
                 for feature in strings.availible_features
             ],
@@ -38,16 +42,16 @@ class ManageConfigSelect(ui.Select):
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(thinking=False)
 
-        for feature in strings.availible_features:
-            if feature["flag_name"] in self.values:
-                setattr(self.settings.flags, feature["flag_name"], True)
+        for feature in self.strings.availible_features:
+            if feature.flag_name in self.values:
+                setattr(self.settings.flags, feature.flag_name, True)
             else:
-                setattr(self.settings.flags, feature["flag_name"], False)
+                setattr(self.settings.flags, feature.flag_name, False)
 
         await self.settings.update(flags=self.settings.flags)
 
         await interaction.edit_original_message(
-            content=f"{config.emojis.success} {strings.feature_list_updated}",
+            content=f"{config.emojis.success} {self.strings.feature_list_updated}",
             view=None
         )
 
@@ -56,12 +60,14 @@ class ChangeConfigView(ui.View):
     def __init__(self, *, context: "WhiteContext"):
         super().__init__()
         self.context = context
+        self.strings = menu_strings()
+        self.manage_button.label = self.strings.manage_features
 
-    @ui.button(label=strings.manage_features)
+    @ui.button()
     async def manage_button(self, interaction: discord.Interaction, button: ui.Button):
         if interaction.user != self.context.author:
             await interaction.response.send_message(
-                f"{config.emojis.error} {strings.access_denied}",
+                f"{config.emojis.error} {self.strings.access_denied}",
                 ephemeral=True
             )
             return
@@ -69,7 +75,7 @@ class ChangeConfigView(ui.View):
         select_view = ui.View()
         select_view.add_item(ManageConfigSelect(self.context))
         await interaction.response.send_message(
-            strings.choose_features,
+            self.strings.choose_features,
             view=select_view,
             ephemeral=True
         )
@@ -97,16 +103,17 @@ class Config(commands.Cog):
         await ctx.settings.query("flags")
         assert ctx.settings.flags is not None
 
+        strings = menu_strings()
         em = discord.Embed(description=strings.description, color=config.primary_color)
         
         features = []
         for feature in strings.availible_features:
             text = ""
-            if getattr(ctx.settings.flags, feature["flag_name"]):
+            if getattr(ctx.settings.flags, feature.flag_name):
                 text += config.emojis.enabled + " "
             else:
                 text += config.emojis.disabled + " "
-            text += f"**{feature['name']}**\n>>> {feature['description']}"
+            text += f"**{feature.name}**\n>>> {feature.description}"
             
             features.append(text)
         
@@ -0,0 +1,137 @@
+"""
+Commands for the bot owners to look into what the bot is doing.
+"""
+
+import asyncio
+import datetime
+import io
+from typing import TYPE_CHECKING, Optional
+
+import discord
+import yaml
+from discord.ext import commands
+
+import config as config_module
+from utils.metrics import registry
+
+if TYPE_CHECKING:
+    from ..bot import Bot
+    from utils.context import WhiteContext
+
+# Leaves room for the code block markup in a 2000 characters long message
+MAX_INLINE_LENGTH = 1980
+
+
+class Debug(commands.Cog, command_attrs=dict(hidden=True)):
+    def __init__(self, bot: "Bot"):
+        self.bot = bot
+
+    async def cog_check(self, ctx: "WhiteContext") -> bool:
+        return await self.bot.is_owner(ctx.author)
+
+    @commands.command()
+    async def metrics(self, ctx: "WhiteContext", prefix: Optional[str] = None):
+        """Shows the metrics whose names start with the prefix, in the Prometheus format"""
+        if prefix and not prefix.startswith("whitespace_"):
+            prefix = "whitespace_" + prefix
+        text = registry.render(prefix or "")
+        await self.send_text(ctx, text, "metrics.txt")
+
+    async def send_text(self, ctx: "WhiteContext", text: str, filename: str) -> None:
+        if len(text) <= MAX_INLINE_LENGTH:
+            await ctx.send(f"```\n{text}```")
+        else:
+            await ctx.send(file=discord.File(io.BytesIO(text.encode()), filename=filename))
+
+    @commands.command()
+    async def startup(self, ctx: "WhiteContext"):
+        """Shows how long each phase of the startup took"""
+        await self.send_text(ctx, self.bot.startup.report(), "startup.txt")
+
+    @commands.group(invoke_without_command=True)
+    async def sync(self, ctx: "WhiteContext"):
+        """Syncs the application commands that have changed since the last sync"""
+        diffs = await self.bot.sync()
+        await self.send_text(ctx, "\n".join(diff.describe() for diff in diffs), "sync.txt")
+
+    @sync.command(name="diff")
+    async def sync_diff(self, ctx: "WhiteContext"):
+        """Shows what a sync would change, without syncing"""
+        diffs = await self.bot.sync(dry_run=True)
+        await self.send_text(ctx, "\n".join(diff.describe() for diff in diffs), "sync.txt")
+
+    @sync.command(name="force")
+    async def sync_force(self, ctx: "WhiteContext"):
+        """Syncs every scope, even if nothing seems to have changed"""
+        diffs = await self.bot.sync(force=True)
+        await self.send_text(ctx, "\n".join(diff.describe() for diff in diffs), "sync.txt")
+
+    @commands.command(name="reload-config")
+    async def reload_config(self, ctx: "WhiteContext"):
+        """Reads the configuration files and strings again, keeping the current ones if they are invalid"""
+        try:
+            # Reading and parsing YAML would block the event loop for a while
+            compiled = await asyncio.to_thread(config_module.compile_files)
+        except config_module.ConfigError as exc:
+            await self.send_text(ctx, "\n".join(exc.problems), "problems.txt")
+            return
+        except (OSError, yaml.YAMLError) as exc:
+            await ctx.send(f"Failed to read the configuration: {exc}")
+            return
+
+        config_module.swap(*compiled)
+        await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
+
+    @commands.group(invoke_without_command=True)
+    async def profiler(self, ctx: "WhiteContext"):
+        """Shows the state of the event loop profiler"""
+        profiler = self.bot.profiler
+        samples, stacks = profiler.sample_count()
+        await ctx.send(
+            f"Profiler is {'running' if profiler.is_running else 'stopped'}: "
+            f"{samples} samples of {stacks} stacks, "
+            f"{profiler.idle_samples} idle, {profiler.dropped_samples} dropped; "
+            f"the loop was blocked {profiler.total_blocks} times"
+        )
+
+    @profiler.command(name="start")
+    async def profiler_start(self, ctx: "WhiteContext"):
+        """Starts sampling the event loop"""
+        self.bot.profiler.start()
+        await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
+
+    @profiler.command(name="stop")
+    async def profiler_stop(self, ctx: "WhiteContext"):
+        """Stops sampling the event loop, the samples are kept"""
+        self.bot.profiler.stop()
+        await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
+
+    @profiler.command(name="dump")
+    async def profiler_dump(self, ctx: "WhiteContext", reset: bool = False):
+        """Sends the samples as folded stacks, which flamegraph.pl or speedscope can turn into a flame graph"""
+        data = self.bot.profiler.folded().encode()
+        if reset:
+            self.bot.profiler.reset()
+        await ctx.send(file=discord.File(io.BytesIO(data), filename="profile.folded"))
+
+    @profiler.command(name="blocks")
+    async def profiler_blocks(self, ctx: "WhiteContext", count: int = 5):
+        """Shows what the event loop was doing the last times it was blocked"""
+        blocks = list(self.bot.profiler.blocks)[-count:]
+        if not blocks:
+            await ctx.send("The event loop has not been blocked")
+            return
+
+        text = "\n\n".join(
+            "{} ms at {}\n{}".format(
+                round(block.duration * 1000),
+                datetime.datetime.fromtimestamp(block.started, datetime.timezone.utc).isoformat(timespec="seconds"),
+                "".join(block.stack)
+            )
+            for block in reversed(blocks)
+        )
+        await self.send_text(ctx, text, "blocks.txt")
+
+
+async def setup(bot: "Bot"):
+    await bot.add_cog(Debug(bot))
@@ -9,7 +9,7 @@ from discord.utils import format_dt
 from config import config
 from utils.checks import check_has_flag
 from utils.converters import PageConverter, WikiConverter
-from utils.errors import WikiNotFound
+from utils.errors import WikiNotFound, WikiUnavailable
 from utils.wiki import Wiki
 
 if TYPE_CHECKING:
@@ -44,7 +44,7 @@ class Fandom(commands.Cog, name="Фэндом"):
         await ctx.defer()
         if wiki is None:
             if ctx.settings is None:
-                wiki = Wiki.from_dot_notation("ru.community", session=ctx.bot.session)
+                wiki = Wiki.from_dot_notation("ru.community", client=ctx.bot.wiki_client)
             else:
                 await ctx.settings.query_wiki_info()
                 wiki = ctx.wiki
@@ -64,6 +64,8 @@ class Fandom(commands.Cog, name="Фэндом"):
         except IndexError:
             await ctx.send(":warning: Данной страницы не существует. Выполняю поиск...")
             return
+
+        await ctx.bot.wiki_directory.remember(wiki)
         
         em = discord.Embed(
             title=data["title"],
@@ -95,6 +97,8 @@ class Fandom(commands.Cog, name="Фэндом"):
         
         if isinstance(unwrapped, WikiNotFound):
             await ctx.send(f"{config.emojis.error} | Вики с данным адресом не найдена.")
+        elif isinstance(unwrapped, WikiUnavailable):
+            await ctx.send(f"{config.emojis.error} | Вики сейчас не отвечает. Попробуйте ещё раз позже.")
         
 async def setup(bot: commands.Bot):
     await bot.add_cog(Fandom(bot))
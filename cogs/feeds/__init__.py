@@ -0,0 +1,7 @@
+from .cog import Feeds
+from bot import Bot
+
+__all__ = ("setup",)
+
+async def setup(bot: Bot) -> None:
+    await bot.add_cog(Feeds(bot))
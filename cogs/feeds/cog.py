@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional
+
+import aiohttp
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+from config import config
+from utils.context import WhiteContext
+from utils.converters import WikiConverter
+from utils.metrics import registry
+from utils.wiki import Wiki
+from .engine import SUBSCRIPTIONS_CHANNEL, FeedEngine
+from .outbox import NOTIFY_CHANNEL
+
+if TYPE_CHECKING:
+    from bot import Bot
+
+
+class Feeds(commands.Cog, name="Ленты правок"):
+    """Выводит свежие правки с вики в каналы сервера."""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.engine = FeedEngine.from_config(bot, config.feeds)
+
+    async def cog_load(self) -> None:
+        # Before loading, so that no change made in the meantime is missed
+        listener = self.bot.settings_listener
+        await listener.listen(SUBSCRIPTIONS_CHANNEL, self.engine.on_subscription_changed)
+        await listener.listen(NOTIFY_CHANNEL, self.engine.on_outbox_added)
+        await self.engine.load()
+
+        outbox = self.engine.outbox
+        registry.callback(
+            "whitespace_feed_outbox_pending",
+            "Feed items waiting to be sent",
+            (),
+            lambda: {(): outbox.pending}
+        )
+        registry.callback(
+            "whitespace_feed_items_total",
+            "Feed items sent to channels or skipped",
+            ("result",),
+            lambda: {("sent",): outbox.sent_items, ("skipped",): outbox.skipped_items},
+            type="counter"
+        )
+        registry.callback(
+            "whitespace_feed_messages_total",
+            "Messages sent to feed channels",
+            (),
+            lambda: {(): outbox.sent_messages},
+            type="counter"
+        )
+
+    async def cog_unload(self) -> None:
+        await self.bot.settings_listener.unlisten(SUBSCRIPTIONS_CHANNEL)
+        await self.bot.settings_listener.unlisten(NOTIFY_CHANNEL)
+        self.engine.stop()
+        for name in (
+            "whitespace_feed_outbox_pending",
+            "whitespace_feed_items_total",
+            "whitespace_feed_messages_total"
+        ):
+            registry.unregister(name)
+
+    @commands.Cog.listener()
+    async def on_notifications_reconnected(self):
+        await self.engine.catch_up()
+
+    @commands.hybrid_group()
+    @commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    @commands.has_permissions(manage_guild=True)
+    async def feed(self, ctx: WhiteContext):
+        """Управляет лентами правок на сервере"""
+        if ctx.invoked_subcommand is None:
+            await ctx.send_help(ctx.command)
+
+    @feed.command()
+    async def subscribe(
+        self,
+        ctx: WhiteContext,
+        wiki: Wiki = commands.param(converter=WikiConverter),
+        channel: Optional[discord.TextChannel] = None
+    ):
+        """Начинает выводить правки с вики в канал.
+
+        Аргументы:
+            wiki: Вики, правки с которой нужно выводить
+            channel: Канал для правок (по умолчанию — текущий)
+        """
+        assert ctx.guild is not None
+        target = channel or ctx.channel
+        try:
+            await wiki.query(meta="siteinfo")
+        except aiohttp.ContentTypeError:
+            await ctx.send(f"{config.emojis.error} | Вики с данным адресом не найдена.")
+            return
+
+        if await self.engine.subscribe(ctx.guild.id, target.id, wiki):
+            await self.bot.wiki_directory.remember(wiki)
+            await ctx.send(f"{config.emojis.success} | Правки с <{wiki.url}> будут появляться в {target.mention}.")  # type: ignore
+        else:
+            await ctx.send(f"{config.emojis.error} | Этот канал уже получает правки с <{wiki.url}>.")
+
+    @feed.command()
+    async def unsubscribe(
+        self,
+        ctx: WhiteContext,
+        wiki: Wiki = commands.param(converter=WikiConverter),
+        channel: Optional[discord.TextChannel] = None
+    ):
+        """Прекращает выводить правки с вики в канал.
+
+        Аргументы:
+            wiki: Вики, правки с которой больше не нужны
+            channel: Канал с правками (по умолчанию — текущий)
+        """
+        assert wiki.url is not None
+        target = channel or ctx.channel
+        if await self.engine.unsubscribe(target.id, wiki.url):
+            await ctx.send(f"{config.emojis.success} | Правки с <{wiki.url}> больше не будут появляться в {target.mention}.")  # type: ignore
+        else:
+            await ctx.send(f"{config.emojis.error} | Этот канал не получает правки с <{wiki.url}>.")
+
+    @feed.command(name="list")
+    async def list_(self, ctx: WhiteContext):
+        """Показывает ленты правок на сервере"""
+        assert ctx.guild is not None
+        subscriptions = await self.engine.subscriptions_of(ctx.guild.id)
+        if not subscriptions:
+            await ctx.send("На этом сервере нет лент правок.")
+            return
+
+        em = discord.Embed(
+            title="Ленты правок",
+            description="\n".join(f"<#{channel_id}> ← <{url}>" for channel_id, url in subscriptions)[:4096],
+            color=config.primary_color
+        )
+        await ctx.send(embed=em)
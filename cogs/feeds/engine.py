@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Awaitable, Dict, List, Optional, Set, Tuple
+
+from utils.wiki import Wiki
+from .outbox import FeedOutbox
+from .poller import Position, RecentChange, WikiPoller
+
+if TYPE_CHECKING:
+    from bot import Bot
+
+log = logging.getLogger(__name__)
+
+# Sent by a trigger on wh_feed_subscriptions
+SUBSCRIPTIONS_CHANNEL = "wh_feed_subscriptions_changed"
+
+
+class FeedEngine:
+    """Runs a single recent changes poller per wiki, whatever the number of subscribers.
+
+    New changes of a wiki are handed to the outbox once for all channels
+    subscribed to it. When the bot runs in several processes, every wiki is
+    polled by only one of them, chosen by the hash of its url, and the outbox
+    passes the changes on to the processes handling the other channels. Every
+    process knows all subscriptions and keeps them in sync through
+    notifications, so it can tell which wikis it polls and for whom.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        outbox: FeedOutbox,
+        *,
+        min_interval: float,
+        max_interval: float,
+        target_batch: int,
+        limit: int
+    ):
+        self.bot = bot
+        self.outbox = outbox
+        outbox.on_channel_gone = self.remove_channel
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_batch = target_batch
+        self.limit = limit
+
+        # wiki url -> channel id -> guild id, of all processes
+        self.subscriptions: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._pollers: Dict[str, WikiPoller] = {}
+        self._tasks: Set[asyncio.Task[Any]] = set()
+        # Notifications received while the subscriptions are being loaded
+        self._held: Optional[List[Dict[str, Any]]] = None
+
+    @classmethod
+    def from_config(cls, bot: Bot, config) -> FeedEngine:
+        return cls(
+            bot,
+            FeedOutbox.from_config(bot, config.outbox),
+            min_interval=config.min_interval,
+            max_interval=config.max_interval,
+            target_batch=config.target_batch,
+            limit=config.limit
+        )
+
+    def is_local(self, guild_id: int) -> bool:
+        """Tells whether the guild is handled by the shards of this process."""
+        shard_ids = self.bot.shard_ids
+        if shard_ids is None or self.bot.shard_count is None:
+            return True
+        return (guild_id >> 22) % self.bot.shard_count in shard_ids
+
+    def owns(self, url: str) -> bool:
+        """Tells whether the wiki is polled by this process."""
+        digest = hashlib.sha256(url.encode()).digest()
+        return int.from_bytes(digest[:8], "big") % self.bot.cluster_count == self.bot.cluster_id
+
+    def local_channels(self, url: Optional[str] = None) -> Set[int]:
+        """Returns the channels of this process subscribed to the wiki, or to any wiki."""
+        urls = [url] if url is not None else list(self.subscriptions)
+        return {
+            channel_id
+            for wiki_url in urls
+            for channel_id, guild_id in self.subscriptions.get(wiki_url, {}).items()
+            if self.is_local(guild_id)
+        }
+
+    async def load(self) -> None:
+        await self.refresh()
+        await self.outbox.load(self.local_channels())
+
+        log.info(
+            "Polling recent changes of %d out of %d wikis for %d subscriptions",
+            len(self._pollers), len(self.subscriptions),
+            sum(len(channels) for channels in self.subscriptions.values())
+        )
+
+    async def refresh(self) -> None:
+        """Loads the subscriptions again, starting and stopping pollers to match them."""
+        self._held = []
+        try:
+            async with self.bot.pool.acquire() as conn:
+                subscriptions = await conn.fetch("SELECT guild_id, channel_id, wiki_url FROM wh_feed_subscriptions")
+                positions = await conn.fetch("SELECT wiki_url, last_rcid, last_timestamp FROM wh_feed_positions")
+
+            saved = {row["wiki_url"]: Position(row["last_rcid"], row["last_timestamp"]) for row in positions}
+            self.subscriptions.clear()
+            for row in subscriptions:
+                self.subscriptions[row["wiki_url"]][row["channel_id"]] = row["guild_id"]
+
+            for url in list(self._pollers):
+                if url not in self.subscriptions:
+                    self._pollers.pop(url).stop()
+            for url in self.subscriptions:
+                if self.owns(url):
+                    self._start_poller(url, saved.get(url))
+        finally:
+            # Applied on top of the loaded rows, which they might be newer than
+            held, self._held = self._held, None
+            for data in held:
+                self.on_subscription_changed(data)
+
+    def stop(self) -> None:
+        for poller in self._pollers.values():
+            poller.stop()
+        self._pollers.clear()
+        for task in self._tasks:
+            task.cancel()
+        self.outbox.close()
+
+    def on_subscription_changed(self, data: Dict[str, Any]) -> None:
+        """Applies a subscription added or removed by any process."""
+        if self._held is not None:
+            self._held.append(data)
+        elif data["op"] == "DELETE":
+            self._remove(data["channel_id"], data["wiki_url"])
+        else:
+            self._add(data["guild_id"], data["channel_id"], data["wiki_url"])
+
+    def on_outbox_added(self, data: Dict[str, Any]) -> None:
+        """Queues the items that the process polling a wiki stored for the channels of this one."""
+        if data["cluster_id"] == self.bot.cluster_id:
+            return
+
+        channels = self.local_channels(data["wiki_url"])
+        if channels:
+            self._spawn(self.outbox.load(
+                channels, wiki_url=data["wiki_url"], rcids=(data["first_rcid"], data["last_rcid"])
+            ))
+
+    async def catch_up(self) -> None:
+        """Picks up whatever was missed while notifications were not received."""
+        await self.refresh()
+        await self.outbox.load(self.local_channels())
+
+    def _spawn(self, aw: Awaitable[Any]) -> None:
+        task = asyncio.ensure_future(aw)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _add(self, guild_id: int, channel_id: int, url: str) -> None:
+        self.subscriptions[url][channel_id] = guild_id
+        if self.owns(url):
+            self._start_poller(url)
+
+    def _remove(self, channel_id: int, url: str) -> None:
+        channels = self.subscriptions.get(url)
+        if channels is None:
+            return
+
+        channels.pop(channel_id, None)
+        if not channels:
+            # Nobody needs the wiki anymore
+            del self.subscriptions[url]
+            poller = self._pollers.pop(url, None)
+            if poller is not None:
+                poller.stop()
+
+    def _start_poller(self, url: str, position: Optional[Position] = None) -> None:
+        if url in self._pollers:
+            return
+
+        poller = self._pollers[url] = WikiPoller(
+            Wiki(url=url, client=self.bot.wiki_client),
+            self._dispatch,
+            position=position,
+            min_interval=self.min_interval,
+            max_interval=self.max_interval,
+            target_batch=self.target_batch,
+            limit=self.limit
+        )
+        poller.start()
+
+    async def subscribe(self, guild_id: int, channel_id: int, wiki: Wiki) -> bool:
+        """Subscribes the channel to the wiki, returns False if it already was."""
+        assert wiki.url is not None
+        url = wiki.url.rstrip("/")
+
+        query = """
+        INSERT INTO wh_feed_subscriptions (guild_id, channel_id, wiki_url) VALUES ($1, $2, $3)
+        ON CONFLICT DO NOTHING
+        """
+        async with self.bot.pool.acquire() as conn:
+            result = await conn.execute(query, guild_id, channel_id, url)
+        if result == "INSERT 0 0":
+            return False
+
+        # The notification does the same, but the command should not depend on it
+        self._add(guild_id, channel_id, url)
+        return True
+
+    async def unsubscribe(self, channel_id: int, wiki_url: str) -> bool:
+        """Unsubscribes the channel from the wiki, returns False if it was not subscribed."""
+        url = wiki_url.rstrip("/")
+        query = "DELETE FROM wh_feed_subscriptions WHERE channel_id=$1 AND wiki_url=$2"
+        async with self.bot.pool.acquire() as conn:
+            result = await conn.execute(query, channel_id, url)
+        if result == "DELETE 0":
+            return False
+
+        self._remove(channel_id, url)
+        await self.outbox.discard(channel_id, url)
+        return True
+
+    async def remove_channel(self, channel_id: int) -> None:
+        """Removes every subscription of a channel the bot cannot post to anymore."""
+        guild_id = next(
+            (channels[channel_id] for channels in self.subscriptions.values() if channel_id in channels), None
+        )
+        guild = self.bot.get_guild(guild_id) if guild_id is not None else None
+        if guild is not None and guild.unavailable:
+            # Its channels are unknown during an outage, not gone
+            return
+
+        query = "DELETE FROM wh_feed_subscriptions WHERE channel_id=$1 RETURNING wiki_url"
+        async with self.bot.pool.acquire() as conn:
+            rows = await conn.fetch(query, channel_id)
+        for row in rows:
+            self._remove(channel_id, row["wiki_url"])
+        if rows:
+            log.warning("Removed %d feed subscriptions of channel %s", len(rows), channel_id)
+
+    async def subscriptions_of(self, guild_id: int) -> List[Tuple[int, str]]:
+        query = "SELECT channel_id, wiki_url FROM wh_feed_subscriptions WHERE guild_id=$1 ORDER BY channel_id"
+        async with self.bot.pool.acquire() as conn:
+            return [(row["channel_id"], row["wiki_url"]) for row in await conn.fetch(query, guild_id)]
+
+    async def _save_position(self, url: str, position: Position) -> None:
+        query = """
+        INSERT INTO wh_feed_positions (wiki_url, last_rcid, last_timestamp) VALUES ($1, $2, $3)
+        ON CONFLICT (wiki_url) DO UPDATE
+        SET last_rcid = excluded.last_rcid, last_timestamp = excluded.last_timestamp
+        """
+        async with self.bot.pool.acquire() as conn:
+            await conn.execute(query, url, position.rcid, position.timestamp)
+
+    async def _dispatch(self, poller: WikiPoller, changes: List[RecentChange], position: Position) -> None:
+        url = poller.wiki.url
+        assert url is not None
+
+        await self.outbox.put(self.subscriptions.get(url, {}), url, changes, local=self.local_channels(url))
+        # Only this process polls the wiki, so nobody else moves its position
+        await self._save_position(url, position)
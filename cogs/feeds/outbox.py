@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import TYPE_CHECKING, Awaitable, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import discord
+
+from utils.client import TokenBucket
+from utils.wiki import Wiki
+from .poller import RecentChange
+from .render import render_change, render_skipped
+
+if TYPE_CHECKING:
+    from bot import Bot
+
+log = logging.getLogger(__name__)
+
+# Discord does not accept more embeds in one message
+EMBEDS_PER_MESSAGE = 10
+
+# Tells the other processes that items for their channels were stored
+NOTIFY_CHANNEL = "wh_feed_outbox_added"
+
+
+class OutboxItem(NamedTuple):
+    wiki_url: str
+    change: RecentChange
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return self.wiki_url, self.change.rcid
+
+
+class _Channel:
+    def __init__(self, rate: float, burst: int):
+        self.items: Deque[OutboxItem] = deque()
+        # Keys of the items queued or being sent, until they are removed from the database
+        self.queued: Set[Tuple[str, int]] = set()
+        self.skipped = 0
+        self.bucket = TokenBucket(rate, burst)
+        self.task: Optional[asyncio.Task[None]] = None
+
+
+def _same_page(first: OutboxItem, second: OutboxItem) -> bool:
+    return (
+        first.wiki_url == second.wiki_url
+        and first.change.title == second.change.title
+        and first.change.user == second.change.user
+    )
+
+
+def collapse(items: Iterable[OutboxItem]) -> List[Tuple[OutboxItem, int]]:
+    """Merges consecutive edits of the same page by the same user into one item.
+
+    Returns the merged items along with the number of edits each one stands for.
+    """
+    result: List[Tuple[OutboxItem, int]] = []
+    for item in items:
+        if result and _same_page(result[-1][0], item):
+            last, count = result[-1]
+            previous, change = last.change, item.change
+            merged = previous._replace(
+                rcid=change.rcid,
+                revid=change.revid,
+                timestamp=change.timestamp,
+                comment=change.comment,
+                size_diff=previous.size_diff + change.size_diff,
+                minor=previous.minor and change.minor,
+                bot=previous.bot and change.bot
+            )
+            result[-1] = (OutboxItem(item.wiki_url, merged), count + 1)
+        else:
+            result.append((item, 1))
+    return result
+
+
+class FeedOutbox:
+    """Delivers feed items to channels, packing them into as few messages as possible.
+
+    Items of a channel are collected for ``flush_window`` seconds and then sent
+    with up to ten embeds per message, consecutive edits of a page collapsed into
+    one. Messages go out no faster than the per-channel and global rates allow.
+    A channel that gets more than ``max_pending`` items behind loses the oldest
+    ones, replaced by a note saying how many were skipped.
+
+    Items are stored in wh_feed_outbox until they are delivered or skipped,
+    so they survive a restart. The table is also how items reach channels
+    handled by other processes: they are stored by the process that polls the
+    wiki and loaded by the one that handles the channel when it is notified.
+
+    When a channel is gone or the bot may not post there anymore, its items
+    are discarded and ``on_channel_gone`` is awaited, if set, so that the
+    channel stops getting new ones.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        flush_window: float = 2,
+        max_pending: int = 200,
+        channel_rate: float = 1,
+        channel_burst: int = 5,
+        global_rate: float = 40,
+        max_retries: int = 3
+    ):
+        self.bot = bot
+        self.flush_window = flush_window
+        self.max_pending = max_pending
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.max_retries = max_retries
+        # The limit is shared by all processes, each one gets an equal part of it
+        rate = global_rate / bot.cluster_count
+        self.global_bucket = TokenBucket(rate, max(rate, 1))
+
+        self._channels: Dict[int, _Channel] = {}
+        self._tasks: Set[asyncio.Task[None]] = set()
+        self.on_channel_gone: Optional[Callable[[int], Awaitable[None]]] = None
+
+        self.sent_messages = 0
+        self.sent_items = 0
+        self.skipped_items = 0
+
+    @classmethod
+    def from_config(cls, bot: Bot, config) -> FeedOutbox:
+        return cls(
+            bot,
+            flush_window=config.flush_window,
+            max_pending=config.max_pending,
+            channel_rate=config.channel_rate,
+            channel_burst=config.channel_burst,
+            global_rate=config.global_rate
+        )
+
+    @property
+    def pending(self) -> int:
+        return sum(len(state.items) for state in self._channels.values())
+
+    def close(self) -> None:
+        # Whatever is left stays in the database for the next start
+        for state in self._channels.values():
+            if state.task is not None:
+                state.task.cancel()
+        self._channels.clear()
+
+    async def load(
+        self,
+        channel_ids: Iterable[int],
+        *,
+        wiki_url: Optional[str] = None,
+        rcids: Optional[Tuple[int, int]] = None
+    ) -> None:
+        """Queues the items stored for the given channels, only those of a wiki and an rcid range if set.
+
+        Items that are already queued are not queued again.
+        """
+        query = """
+        SELECT channel_id, wiki_url, change FROM wh_feed_outbox
+        WHERE channel_id = ANY($1::bigint[])
+          AND ($2::text IS NULL OR wiki_url = $2)
+          AND ($3::bigint IS NULL OR rcid BETWEEN $3 AND $4)
+        ORDER BY created_at, rcid
+        """
+        first, last = rcids if rcids is not None else (None, None)
+        async with self.bot.pool.acquire() as conn:
+            rows = await conn.fetch(query, list(channel_ids), wiki_url, first, last)
+
+        for row in rows:
+            item = OutboxItem(row["wiki_url"], RecentChange(**json.loads(row["change"])))
+            self._enqueue(row["channel_id"], [item])
+
+        if rows and wiki_url is None:
+            log.info("Loaded %d undelivered feed items", len(rows))
+
+    async def put(
+        self,
+        channel_ids: Iterable[int],
+        wiki_url: str,
+        changes: List[RecentChange],
+        *,
+        local: Optional[Set[int]] = None
+    ) -> None:
+        """Stores the changes for delivery to every channel.
+
+        Only the ``local`` channels, all of them by default, are queued here.
+        The processes handling the rest are notified to load their items.
+        """
+        channel_ids = list(channel_ids)
+        if not channel_ids or not changes:
+            return
+
+        query = """
+        INSERT INTO wh_feed_outbox (channel_id, wiki_url, rcid, change)
+        SELECT channel_id, $2, rcid, change::jsonb
+        FROM unnest($1::bigint[], $3::bigint[], $4::text[]) AS t(channel_id, rcid, change)
+        ON CONFLICT DO NOTHING
+        """
+        payloads = [json.dumps(change._asdict()) for change in changes]
+        remote = local is not None and any(channel_id not in local for channel_id in channel_ids)
+        async with self.bot.pool.acquire() as conn:
+            await conn.execute(
+                query,
+                [channel_id for channel_id in channel_ids for _ in changes],
+                wiki_url,
+                [change.rcid for _ in channel_ids for change in changes],
+                [payload for _ in channel_ids for payload in payloads]
+            )
+            if remote:
+                # The range keeps the payload small whatever the number of changes
+                notification = dict(
+                    cluster_id=self.bot.cluster_id,
+                    wiki_url=wiki_url,
+                    first_rcid=min(change.rcid for change in changes),
+                    last_rcid=max(change.rcid for change in changes)
+                )
+                await conn.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, json.dumps(notification))
+
+        items = [OutboxItem(wiki_url, change) for change in changes]
+        for channel_id in channel_ids:
+            if local is None or channel_id in local:
+                self._enqueue(channel_id, items)
+
+    async def discard(self, channel_id: int, wiki_url: Optional[str] = None) -> None:
+        """Forgets the items of the channel, only those of the given wiki if it is set."""
+        state = self._channels.get(channel_id)
+        if state is not None:
+            kept = [item for item in state.items if wiki_url is not None and item.wiki_url != wiki_url]
+            state.items = deque(kept)
+            state.queued.difference_update(
+                key for key in list(state.queued) if wiki_url is None or key[0] == wiki_url
+            )
+
+        query = "DELETE FROM wh_feed_outbox WHERE channel_id=$1 AND ($2::text IS NULL OR wiki_url=$2)"
+        async with self.bot.pool.acquire() as conn:
+            await conn.execute(query, channel_id, wiki_url)
+
+    def _enqueue(self, channel_id: int, items: List[OutboxItem]) -> None:
+        state = self._channels.get(channel_id)
+        if state is None:
+            state = self._channels[channel_id] = _Channel(self.channel_rate, self.channel_burst)
+
+        items = [item for item in items if item.key not in state.queued]
+        state.items.extend(items)
+        state.queued.update(item.key for item in items)
+        overflow = len(state.items) - self.max_pending
+        if overflow > 0:
+            # A channel this far behind is better off without the oldest items than hours late
+            dropped = [state.items.popleft() for _ in range(overflow)]
+            state.skipped += overflow
+            self.skipped_items += overflow
+            task = asyncio.create_task(self._forget(channel_id, dropped))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if state.task is None:
+            state.task = asyncio.create_task(self._flush_later(channel_id, state))
+
+    async def _forget(self, channel_id: int, items: List[OutboxItem]) -> None:
+        query = """
+        DELETE FROM wh_feed_outbox AS o
+        USING unnest($2::text[], $3::bigint[]) AS t(wiki_url, rcid)
+        WHERE o.channel_id = $1 AND o.wiki_url = t.wiki_url AND o.rcid = t.rcid
+        """
+        try:
+            async with self.bot.pool.acquire() as conn:
+                await conn.execute(
+                    query, channel_id, [item.wiki_url for item in items], [item.change.rcid for item in items]
+                )
+        except Exception:
+            log.exception("Failed to remove delivered feed items of %s", channel_id)
+        finally:
+            state = self._channels.get(channel_id)
+            if state is not None:
+                state.queued.difference_update(item.key for item in items)
+
+    def _next_batch(self, state: _Channel) -> Tuple[List[discord.Embed], List[OutboxItem]]:
+        """Takes as many items as fit into one message, returns their embeds and the items."""
+        embeds = []
+        if state.skipped:
+            embeds.append(render_skipped(state.skipped))
+
+        taken: List[OutboxItem] = []
+        slots = EMBEDS_PER_MESSAGE - len(embeds)
+        while state.items:
+            item = state.items[0]
+            if not (taken and _same_page(taken[-1], item)):
+                # Edits that collapse into the previous embed do not need a slot of their own
+                if slots == 0:
+                    break
+                slots -= 1
+            taken.append(state.items.popleft())
+
+        embeds.extend(
+            render_change(Wiki(url=item.wiki_url), item.change, count=count)
+            for item, count in collapse(taken)
+        )
+        return embeds, taken
+
+    @staticmethod
+    def _retry_after(exc: discord.HTTPException) -> Optional[float]:
+        if exc.status != 429:
+            return None
+
+        try:
+            return float(exc.response.headers.get("Retry-After", 1))
+        except (AttributeError, ValueError):
+            return 1.0
+
+    async def _send(self, channel: discord.abc.Messageable, state: _Channel, embeds: List[discord.Embed]) -> bool:
+        for _ in range(self.max_retries + 1):
+            await state.bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                await channel.send(embeds=embeds)
+                return True
+            except discord.HTTPException as exc:
+                retry_after = self._retry_after(exc)
+                if retry_after is None:
+                    raise
+                await asyncio.sleep(retry_after)
+
+        return False
+
+    async def _channel_gone(self, channel_id: int, state: _Channel, reason: str) -> None:
+        log.warning("Feed channel %s is %s, discarding its items", channel_id, reason)
+        state.skipped = 0
+        if self.on_channel_gone is not None:
+            await self.on_channel_gone(channel_id)
+        await self.discard(channel_id)
+
+    async def _flush_later(self, channel_id: int, state: _Channel) -> None:
+        try:
+            await self.bot.wait_until_ready()
+            await asyncio.sleep(self.flush_window)
+
+            while state.items or state.skipped:
+                channel = self.bot.get_channel(channel_id)
+                if not isinstance(channel, discord.abc.Messageable):
+                    await self._channel_gone(channel_id, state, "gone")
+                    break
+
+                embeds, items = self._next_batch(state)
+                shown = state.skipped
+                try:
+                    sent = await self._send(channel, state, embeds)
+                except discord.Forbidden:
+                    await self._channel_gone(channel_id, state, "not writable")
+                    break
+                except discord.NotFound:
+                    await self._channel_gone(channel_id, state, "gone")
+                    break
+                except discord.HTTPException as exc:
+                    log.warning("Failed to send feed items to %s (%s)", channel_id, exc)
+                    # The items are lost, the note in the next message counts them
+                    state.skipped += len(items)
+                    self.skipped_items += len(items)
+                    await self._forget(channel_id, items)
+                    if not state.items:
+                        break
+                    continue
+
+                if not sent:
+                    # Still rate limited, the items are sent again after the next flush window
+                    state.items.extendleft(reversed(items))
+                    break
+
+                # More items might have been skipped while the message was being sent
+                state.skipped -= shown
+                self.sent_messages += 1
+                self.sent_items += len(items)
+                await self._forget(channel_id, items)
+        except Exception:
+            log.exception("Failed to flush the feed outbox of %s", channel_id)
+        finally:
+            state.task = None
+            if self._channels.get(channel_id) is state:
+                if state.items:
+                    # Something was queued after the loop had given up
+                    state.task = asyncio.create_task(self._flush_later(channel_id, state))
+                elif not state.skipped:
+                    # Otherwise kept, so that the note goes out with the next items
+                    del self._channels[channel_id]
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+
+from utils.errors import WikiUnavailable
+from utils.wiki import Wiki
+
+log = logging.getLogger(__name__)
+
+RC_PROPS = "title|ids|sizes|flags|user|comment|timestamp"
+
+
+class RecentChange(NamedTuple):
+    rcid: int
+    type: str
+    title: str
+    revid: int
+    old_revid: int
+    user: str
+    timestamp: str
+    comment: str
+    size_diff: int
+    minor: bool
+    bot: bool
+
+    @classmethod
+    def from_api(cls, item: Dict[str, Any]) -> "RecentChange":
+        return cls(
+            rcid=item["rcid"],
+            type=item["type"],
+            title=item["title"],
+            revid=item.get("revid", 0),
+            old_revid=item.get("old_revid", 0),
+            user=item.get("user", ""),
+            timestamp=item["timestamp"],
+            comment=item.get("comment", ""),
+            size_diff=item.get("newlen", 0) - item.get("oldlen", 0),
+            minor=item.get("minor", False),
+            bot=item.get("bot", False)
+        )
+
+
+class Position(NamedTuple):
+    rcid: int
+    timestamp: str
+
+
+class WikiPoller:
+    """Polls the recent changes of one wiki and passes new ones to ``handler``.
+
+    Every poll continues from the last change handled, following ``rccontinue``
+    until the wiki has nothing newer. The position only moves once ``handler``
+    has returned, so the changes it failed to take are polled again.
+
+    The interval between polls follows the edit rate of the wiki: it aims to
+    get about ``target_batch`` changes per poll, staying between
+    ``min_interval`` and ``max_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        wiki: Wiki,
+        handler: Callable[["WikiPoller", List[RecentChange], Position], Awaitable[None]],
+        *,
+        position: Optional[Position] = None,
+        min_interval: float = 15,
+        max_interval: float = 300,
+        target_batch: int = 20,
+        limit: int = 500,
+        max_pages: int = 5
+    ):
+        self.wiki = wiki
+        self.handler = handler
+        self.position = position
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.target_batch = target_batch
+        self.limit = limit
+        self.max_pages = max_pages
+
+        self.interval = min_interval
+        self.rate = 0.0  # changes per second, exponentially smoothed
+        self._last_poll: Optional[float] = None
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def _fetch_latest(self) -> Position:
+        data = await self.wiki.query(
+            list="recentchanges", rcprop="ids|timestamp", rclimit=1, formatversion=2
+        )
+        changes = data["query"]["recentchanges"]
+        if not changes:
+            return Position(0, "1970-01-01T00:00:00Z")
+        return Position(changes[0]["rcid"], changes[0]["timestamp"])
+
+    async def poll(self) -> Tuple[List[RecentChange], Position]:
+        """Returns the changes made since the current position, oldest first, and the position after them.
+
+        The position is not moved, that is up to the caller.
+        """
+        if self.position is None:
+            # Nobody wants to get the whole history of the wiki on subscription
+            return [], await self._fetch_latest()
+
+        params: Dict[str, Any] = dict(
+            list="recentchanges",
+            rcprop=RC_PROPS,
+            rctype="edit|new",
+            rcdir="newer",
+            rcstart=self.position.timestamp,
+            rclimit=self.limit,
+            formatversion=2
+        )
+        changes: List[RecentChange] = []
+        for _ in range(self.max_pages):
+            data = await self.wiki.query(**params)
+            changes.extend(
+                RecentChange.from_api(item)
+                for item in data["query"]["recentchanges"]
+                # rcstart is inclusive, so the last change seen comes again
+                if item["rcid"] > self.position.rcid
+            )
+
+            if "continue" not in data:
+                break
+            params.update(data["continue"])
+
+        if not changes:
+            return changes, self.position
+
+        last = changes[-1]
+        return changes, Position(last.rcid, last.timestamp)
+
+    def _adapt(self, count: int) -> None:
+        now = time.monotonic()
+        last_poll, self._last_poll = self._last_poll, now
+        if last_poll is None:
+            return
+
+        observed = count / max(now - last_poll, 1e-3)
+        self.rate = observed if self.rate == 0 else 0.3 * observed + 0.7 * self.rate
+        # A wiki that has never been edited while we watched slows down gradually
+        interval = self.target_batch / self.rate if self.rate > 0 else self.interval * 2
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                changes, position = await self.poll()
+            except (WikiUnavailable, aiohttp.ClientError, asyncio.TimeoutError, KeyError) as exc:
+                log.warning("Failed to poll recent changes of %s (%r)", self.wiki.url, exc)
+                self.interval = self.max_interval
+            else:
+                self._adapt(len(changes))
+                try:
+                    if changes:
+                        await self.handler(self, changes, position)
+                except Exception:
+                    # The same changes come again with the next poll
+                    log.exception("Failed to handle recent changes of %s", self.wiki.url)
+                else:
+                    self.position = position
+
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import discord
+
+from utils.wiki import Wiki
+from .poller import RecentChange
+
+NEW_PAGE_COLOR = 0x4caf50
+EDIT_COLOR = 0x5d77bf
+REMOVAL_COLOR = 0xe35f5f
+
+# Keeps busy feeds readable, edit summaries are rarely longer anyway
+MAX_COMMENT_LENGTH = 300
+
+
+def render_change(wiki: Wiki, change: RecentChange, count: int = 1) -> discord.Embed:
+    """Builds the embed posted to feed channels for a change, or for ``count`` edits merged into one."""
+    if change.type == "new":
+        color = NEW_PAGE_COLOR
+        link = wiki.url_to(change.title)
+    else:
+        color = REMOVAL_COLOR if change.size_diff < 0 else EDIT_COLOR
+        link = wiki.diff_url(change.revid, change.old_revid or None)
+
+    comment = discord.utils.escape_markdown(change.comment)
+    if len(comment) > MAX_COMMENT_LENGTH:
+        comment = comment[:MAX_COMMENT_LENGTH - 1] + "…"
+
+    em = discord.Embed(
+        title=change.title[:256],
+        url=link,
+        description=comment or None,
+        color=color,
+        timestamp=datetime.fromisoformat(change.timestamp.replace("Z", "+00:00"))
+    )
+    em.set_author(name=change.user, url=wiki.url_to("User:" + change.user))
+
+    flags = []
+    if change.type == "new":
+        flags.append("новая страница")
+    if change.minor:
+        flags.append("малая правка")
+    if change.bot:
+        flags.append("бот")
+    footer = f"{change.size_diff:+d} байт"
+    if count > 1:
+        footer += f" • правок: {count}"
+    if flags:
+        footer += " • " + ", ".join(flags)
+    em.set_footer(text=footer)
+
+    return em
+
+
+def render_skipped(count: int) -> discord.Embed:
+    """Builds the note posted instead of the changes a channel could not keep up with."""
+    return discord.Embed(
+        description=f"Пропущено правок: {count} — канал не успевал их получать.",
+        color=REMOVAL_COLOR
+    )
@@ -1,7 +1,11 @@
-from .cog import Wikilinks
-from bot import Bot
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from bot import Bot
 
 __all__ = ("setup",)
 
-async def setup(bot: Bot) -> None:
-    await bot.add_cog(Wikilinks(bot))
\ No newline at end of file
+async def setup(bot: "Bot") -> None:
+    # Imported here, so that the parser and the other helpers work without discord installed
+    from .cog import Wikilinks
+    await bot.add_cog(Wikilinks(bot))
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import tempfile
+from contextlib import asynccontextmanager
+from typing import IO, AsyncIterator, List, Sequence
+
+import aiohttp
+import discord
+
+from utils.errors import AttachmentBudgetExceeded
+
+
+class AttachmentRelay:
+    """Downloads attachments to upload them again, keeping memory usage bounded.
+
+    All attachments being relayed at the same time share a budget of ``budget``
+    bytes; a message that does not fit into what is left is not relayed at all.
+    Attachments are downloaded concurrently and streamed in chunks: the ones
+    larger than ``spool_threshold`` bytes go to temporary files instead of memory.
+    Disk I/O runs in a thread, in writes of up to ``SPOOL_WRITE_SIZE`` bytes.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    SPOOL_WRITE_SIZE = 1024 * 1024
+
+    def __init__(self, session: aiohttp.ClientSession, *, budget: int, spool_threshold: int):
+        self.session = session
+        self.budget = budget
+        self.spool_threshold = spool_threshold
+        self.available = budget
+
+    async def _download(self, attachment: discord.Attachment) -> discord.File:
+        fp: IO[bytes]
+        spooled = attachment.size > self.spool_threshold
+        if spooled:
+            fp = await asyncio.to_thread(tempfile.TemporaryFile)
+        else:
+            fp = io.BytesIO()
+
+        try:
+            async with self.session.get(attachment.url) as resp:
+                resp.raise_for_status()
+                pending = bytearray()
+                async for chunk in resp.content.iter_chunked(self.CHUNK_SIZE):
+                    if not spooled:
+                        fp.write(chunk)
+                        continue
+
+                    pending += chunk
+                    if len(pending) >= self.SPOOL_WRITE_SIZE:
+                        data, pending = pending, bytearray()
+                        await asyncio.to_thread(fp.write, data)
+
+                if pending:
+                    await asyncio.to_thread(fp.write, pending)
+        except BaseException:
+            fp.close()
+            raise
+
+        fp.seek(0)
+        return discord.File(fp, filename=attachment.filename, spoiler=attachment.is_spoiler())
+
+    @asynccontextmanager
+    async def files(self, attachments: Sequence[discord.Attachment]) -> AsyncIterator[List[discord.File]]:
+        """Downloads the attachments, the files are closed and the budget is freed on exit.
+
+        Raises AttachmentBudgetExceeded if the attachments do not fit into the budget.
+        """
+        if not attachments:
+            yield []
+            return
+
+        size = sum(attachment.size for attachment in attachments)
+        if size > self.available:
+            raise AttachmentBudgetExceeded(size)
+
+        self.available -= size
+        try:
+            results = await asyncio.gather(
+                *(self._download(attachment) for attachment in attachments),
+                return_exceptions=True
+            )
+            files = [result for result in results if isinstance(result, discord.File)]
+            try:
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
+
+                yield files
+            finally:
+                for file in files:
+                    file.close()
+        finally:
+            self.available += size
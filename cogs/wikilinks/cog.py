@@ -1,21 +1,37 @@
 from __future__ import annotations
 
-import re
-from typing import TYPE_CHECKING, Any, Dict, List
+import asyncio
+import logging
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any, Dict, List, Match, NamedTuple, Optional
 
+import aiohttp
 from discord.ext import commands
 import discord
+from config import config
 from utils.checks import guild_has_flag
+from utils.errors import AttachmentBudgetExceeded, WikiUnavailable
+from utils.metrics import registry, timed
 
 from utils.context import WhiteContext
+from utils.wiki import Wiki
 
+from .attachments import AttachmentRelay
 from .link import Link
+from .prefixes import INTERWIKI, PrefixIndex
+from .queue import SendQueue
+from .resolver import TitleResolver
+from .parser import find_wikilink_matches, has_wikilink_candidates, substitute
 if TYPE_CHECKING:
     from bot import Bot
 
+log = logging.getLogger(__name__)
 
-WIKILINK_REGEX = re.compile(r"\[\[(.+?)(?:\|(.*?))?\]\]([^ `\n]+)?")
-CODEBLOCK_REGEX = re.compile(r"(`{1,3}).*?\1", re.DOTALL)
+
+class SendJob(NamedTuple):
+    ctx: WhiteContext
+    links: List[Link]
+    content: str
 
 
 class Wikilinks(commands.Cog):
@@ -23,31 +39,124 @@ class Wikilinks(commands.Cog):
 
     def __init__(self, bot: Bot):
         self.bot = bot
+        self._webhooks: Dict[int, discord.Webhook] = {}
+        self.webhook_hits = 0
+        self.webhook_misses = 0
+        # Makes sure that only one webhook gets created per channel,
+        # even if a bunch of links is sent there at the same time
+        self._webhook_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.interwiki: Dict[int, PrefixIndex] = {}
+        self.resolver = TitleResolver(window=config.wikilinks.verify_window)
+        self.attachment_relay = AttachmentRelay(
+            bot.session,
+            budget=config.wikilinks.attachment_budget,
+            spool_threshold=config.wikilinks.attachment_spool_threshold
+        )
+        self.send_queue: SendQueue[SendJob] = SendQueue(
+            self.deliver,
+            workers=config.wikilinks.queue_workers,
+            max_depth=config.wikilinks.queue_max_depth,
+            idle_timeout=config.wikilinks.queue_idle_timeout,
+            fallback=self.deliver_links
+        )
+
+    async def cog_load(self) -> None:
+        assert self.bot.pool is not None
+
+        query = "SELECT channel_id, webhook_url FROM wh_wikilink_webhooks"
+        async with self.bot.pool.acquire() as conn:
+            result = await conn.fetch(query)
+
+        self._webhooks = {
+            row["channel_id"]: discord.Webhook.from_url(row["webhook_url"], session=self.bot.session)
+            for row in result
+        }
+
+        await self.load_interwiki()
+
+        registry.callback(
+            "whitespace_wikilinks_queue",
+            "Messages waiting to be resent and channels with a queue",
+            ("kind",),
+            lambda: {("pending",): self.send_queue.pending, ("channels",): self.send_queue.channels}
+        )
+        registry.callback(
+            "whitespace_wikilinks_rejected_total",
+            "Messages answered with plain links because their channel queue was full",
+            (),
+            lambda: {(): self.send_queue.rejected},
+            type="counter"
+        )
+        registry.callback(
+            "whitespace_webhook_cache_lookups_total",
+            "Lookups of the webhook cache",
+            ("result",),
+            lambda: {("hit",): self.webhook_hits, ("miss",): self.webhook_misses},
+            type="counter"
+        )
+
+    async def cog_unload(self) -> None:
+        self.send_queue.close()
+        for name in (
+            "whitespace_wikilinks_queue",
+            "whitespace_wikilinks_rejected_total",
+            "whitespace_webhook_cache_lookups_total"
+        ):
+            registry.unregister(name)
+
+    async def load_interwiki(self) -> None:
+        """Loads interwiki prefixes defined by guilds on top of the built-in ones."""
+        assert self.bot.pool is not None
+
+        query = "SELECT guild_id, prefix, url FROM wh_interwiki_prefixes"
+        async with self.bot.pool.acquire() as conn:
+            result = await conn.fetch(query)
+
+        templates: Dict[int, Dict[str, str]] = defaultdict(dict)
+        for row in result:
+            templates[row["guild_id"]][row["prefix"]] = row["url"]
 
-    async def find_wikilinks(self, ctx: WhiteContext) -> List[Link]:
-        text = ctx.message.content
-        codeblock_matches = list(CODEBLOCK_REGEX.finditer(text))
-        link_matches = list(WIKILINK_REGEX.finditer(text))
-        if len(link_matches) == 0:
+        self.interwiki = {
+            guild_id: PrefixIndex.from_templates(guild_templates, parent=INTERWIKI)
+            for guild_id, guild_templates in templates.items()
+        }
+
+    @timed("wikilinks.find_wikilinks")
+    async def find_wikilinks(self, ctx: WhiteContext, matches: Optional[List[Match[str]]] = None) -> List[Link]:
+        if matches is None:
+            matches = find_wikilink_matches(ctx.message.content)
+        if len(matches) == 0:
             return []
 
         await ctx.settings.query_wiki_info()  # type: ignore
 
-        links = []
-        for link in link_matches:
-            is_within_codeblock = False
-            
-            for match in codeblock_matches:
-                if link.start(0) > match.start(0) and link.end(0) < match.end(0):
-                    is_within_codeblock = True
+        prefixes = self.interwiki.get(ctx.guild.id, INTERWIKI)  # type: ignore
+        links = [Link(match, wiki=ctx.wiki, prefixes=prefixes) for match in matches]
 
-            if is_within_codeblock:
-                continue
-            
-            links.append(Link(link, wiki=ctx.wiki))
+        if await guild_has_flag(ctx, "beta_verified_wikilinks_enabled"):
+            await self.verify_links(ctx.wiki, links)
 
         return links
 
+    async def verify_links(self, wiki: Wiki, links: List[Link]) -> None:
+        """Follows redirects and marks missing pages for the links to the given wiki."""
+        local = [link for link in links if not link.is_interwiki and link.page]
+        if not local:
+            return
+
+        try:
+            # Shielded because other messages may wait for the same titles
+            info = await asyncio.wait_for(
+                asyncio.shield(self.resolver.resolve(wiki, (link.page for link in local))),
+                config.wikilinks.verify_timeout
+            )
+        except (WikiUnavailable, aiohttp.ClientError, asyncio.TimeoutError):
+            # Unverified links are still better than no links at all
+            return
+
+        for link in local:
+            link.resolve(info[link.page])
+
     async def create_webhook(self, channel: discord.TextChannel) -> discord.Webhook:
         webhook = await channel.create_webhook(name="Wikilink Manager")
 
@@ -60,19 +169,44 @@ class Wikilinks(commands.Cog):
         async with self.bot.pool.acquire() as conn:
             await conn.execute(query, channel.id, webhook.url)
         
+        self._webhooks[channel.id] = webhook
         return webhook
 
+    @timed("wikilinks.get_webhook")
     async def get_webhook(self, channel: discord.TextChannel) -> discord.Webhook:
+        if (webhook := self._webhooks.get(channel.id)) is not None:
+            self.webhook_hits += 1
+            return webhook
+
+        self.webhook_misses += 1
+
         assert self.bot.pool is not None
-        
-        query = "SELECT webhook_url FROM wh_wikilink_webhooks WHERE channel_id=$1"
-        async with self.bot.pool.acquire() as conn:
-            result = await conn.fetchrow(query, channel.id)
-        
-        if result is None:
-            return await self.create_webhook(channel)
 
-        return discord.Webhook.from_url(result["webhook_url"], session=self.bot.session)
+        async with self._webhook_locks[channel.id]:
+            # Somebody might have fetched or created it while we were waiting
+            if (webhook := self._webhooks.get(channel.id)) is not None:
+                return webhook
+
+            query = "SELECT webhook_url FROM wh_wikilink_webhooks WHERE channel_id=$1"
+            async with self.bot.pool.acquire() as conn:
+                result = await conn.fetchrow(query, channel.id)
+            
+            if result is None:
+                return await self.create_webhook(channel)
+
+            webhook = discord.Webhook.from_url(result["webhook_url"], session=self.bot.session)
+            self._webhooks[channel.id] = webhook
+            return webhook
+
+    async def replace_webhook(self, channel: discord.TextChannel, stale: discord.Webhook) -> discord.Webhook:
+        """Creates a new webhook in place of the one that was deleted from the channel."""
+        async with self._webhook_locks[channel.id]:
+            webhook = self._webhooks.get(channel.id)
+            if webhook is not None and webhook.id != stale.id:
+                return webhook
+
+            self._webhooks.pop(channel.id, None)
+            return await self.create_webhook(channel)
 
     def get_webhook_channel(self, channel: discord.abc.Messageable) -> discord.TextChannel:
         if isinstance(channel, discord.Thread):
@@ -85,57 +219,81 @@ class Wikilinks(commands.Cog):
         return result  # type: ignore
 
     async def resend_message(self, ctx: WhiteContext, content: str, webhook: discord.Webhook) -> None:
-        try:
-            message = ctx.message
+        message = ctx.message
 
-            if (reference := message.reference) is not None and isinstance(reference.resolved, discord.Message):
-                msg = f"> Ответ на [сообщение]({reference.jump_url}) от "
-                if (author := reference.resolved.author) in message.mentions:
-                    msg += author.mention
-                else:
-                    msg += f"**{author}**"
-                msg += "\n\n"
+        if (reference := message.reference) is not None and isinstance(reference.resolved, discord.Message):
+            msg = f"> Ответ на [сообщение]({reference.jump_url}) от "
+            if (author := reference.resolved.author) in message.mentions:
+                msg += author.mention
+            else:
+                msg += f"**{author}**"
+            msg += "\n\n"
 
-                content = msg + content
+            content = msg + content
 
-            attrs: Dict[str, Any] = dict(
-                content=content,
-                files=[
-                    await attachment.to_file(spoiler=attachment.is_spoiler()) 
-                    for attachment in message.attachments
-                ],
-                username=message.author.display_name,
-                avatar_url=message.author.display_avatar.url,
-                allowed_mentions=discord.AllowedMentions(everyone=False, roles=False)
-            )
-            if isinstance(ctx.channel, discord.Thread):
-                attrs["thread"] = ctx.channel
+        await self._send_with_webhook(ctx, content, webhook)
 
-            await webhook.send(**attrs)
+    async def _send_with_webhook(self, ctx: WhiteContext, content: str, webhook: discord.Webhook) -> None:
+        message = ctx.message
+        try:
+            async with self.attachment_relay.files(message.attachments) as files:
+                attrs: Dict[str, Any] = dict(
+                    content=content,
+                    files=files,
+                    username=message.author.display_name,
+                    avatar_url=message.author.display_avatar.url,
+                    allowed_mentions=discord.AllowedMentions(everyone=False, roles=False)
+                )
+                if isinstance(ctx.channel, discord.Thread):
+                    attrs["thread"] = ctx.channel
+
+                await webhook.send(**attrs)
 
         except discord.NotFound:
             channel = self.get_webhook_channel(ctx.channel)
-            new_webhook = await self.create_webhook(channel)
-            await self.resend_message(ctx, content, new_webhook)
+            new_webhook = await self.replace_webhook(channel, webhook)
+            await self._send_with_webhook(ctx, content, new_webhook)
 
     async def send_links(self, channel: discord.abc.Messageable, links: List[Link]) -> discord.Message:
         content = "\n".join(link.to_link() for link in links)
         return await channel.send(content)
 
     @commands.Cog.listener()
+    @timed("wikilinks.on_message")
     async def on_message(self, message: discord.Message) -> None:
+        # The vast majority of messages contain no wikilinks at all, so the checks
+        # are ordered from the cheapest to the most expensive one: nothing touches
+        # the database or Discord until we know there is something to convert.
         if message.author.bot:
             return
         if message.guild is None:
             return
+        if not has_wikilink_candidates(message.content):
+            return
+
+        matches = find_wikilink_matches(message.content)
+        if len(matches) == 0:
+            return
         
         ctx = await self.bot.get_context(message)
         if not await guild_has_flag(ctx, "beta_new_wikilinks_enabled"):
             return
         
-        links = await self.find_wikilinks(ctx)
-        if len(links) == 0:
-            return
+        links = await self.find_wikilinks(ctx, matches)
+        content = substitute(
+            message.content,
+            ((link.start, link.end, link.to_hyperlink()) for link in links)
+        )
+
+        # Messages are resent in order per channel. If a channel is too far behind,
+        # plain links are cheaper than making everyone wait even longer.
+        channel = self.get_webhook_channel(ctx.channel)
+        if not self.send_queue.submit(channel.id, SendJob(ctx, links, content)):
+            await self.send_links(ctx.channel, links)
+
+    @timed("wikilinks.deliver")
+    async def deliver(self, job: SendJob) -> None:
+        ctx, links, content = job
 
         channel = self.get_webhook_channel(ctx.channel)
         try:
@@ -144,22 +302,36 @@ class Wikilinks(commands.Cog):
             await self.send_links(ctx.channel, links)
             return
         
-        content = message.content
-        for link in links:
-            content = content.replace(link.original, link.to_hyperlink(), 1)
-        
         try:
             await self.resend_message(
                 ctx=ctx,
                 content=content,
                 webhook=webhook
             )
-        except discord.HTTPException:
+        except discord.HTTPException as exc:
+            if exc.status == 429:
+                # Let the queue wait for the rate limit and try again
+                raise
+            await self.send_links(ctx.channel, links)
+            return
+        except (aiohttp.ClientError, AttachmentBudgetExceeded):
             await self.send_links(ctx.channel, links)
             return
 
+        # The copy has been sent, so nothing below may be retried by the queue:
+        # that would post the copy once more
         try:
-            await ctx.message.delete()
-        except discord.Forbidden:
-            await ctx.send("Упс! Получилось некрасиво, потому что у меня нет права управлять сообщениями."
-                           "Пожалуйста, выдайте мне его, и я смогу удалить исходное сообщение.")
+            try:
+                await ctx.message.delete()
+            except discord.Forbidden:
+                await ctx.send("Упс! Получилось некрасиво, потому что у меня нет права управлять сообщениями."
+                               "Пожалуйста, выдайте мне его, и я смогу удалить исходное сообщение.")
+        except discord.NotFound:
+            # The author has already deleted it
+            pass
+        except discord.HTTPException as exc:
+            log.warning("Failed to delete a resent message in %s (%s)", ctx.channel.id, exc)
+
+    async def deliver_links(self, job: SendJob) -> None:
+        """Sends plain links for a job that could not be resent through the webhook."""
+        await self.send_links(job.ctx.channel, job.links)
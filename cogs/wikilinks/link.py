@@ -1,30 +1,68 @@
-from typing import Optional, Match
-from utils.wiki import Wiki
-from .prefixes import PREFIXES
+from typing import Optional, Match, Tuple
+from utils.wiki import PageInfo, Wiki
+from .prefixes import INTERWIKI, PrefixCallable, PrefixIndex
 
 class Link:
-    def __init__(self, match: Match[str], wiki: Wiki) -> None:
-        self.target: str = match.group(1)
-        self.title: Optional[str] = match.group(2)
+    # Links are created for every wikilink in every message, so they are kept
+    # small and only compute their URL when it is actually needed
+    __slots__ = ("target", "title", "wiki", "prefixes", "start", "end", "exists", "_url", "_interwiki")
 
-        if self.title == "":
-            self.title = self.target.split(":")[-1]
-        if self.title is None:
-            self.title = self.target
-        ending = match.group(3) or ""
-        self.title += ending
+    def __init__(self, match: Match[str], wiki: Wiki, prefixes: PrefixIndex = INTERWIKI) -> None:
+        target, title, ending = match.group(1, 2, 3)
+        if title == "":
+            title = target.split(":")[-1]
+        if title is None:
+            title = target
+        if ending:
+            title += ending
 
+        self.target: str = target
+        self.title: str = title
         self.wiki = wiki
-        self.original = match.group(0)
-        self.url = self.make_url()
-    
+        self.prefixes = prefixes
+        self.start, self.end = match.span(0)
+        self.exists: Optional[bool] = None
+        self._url: Optional[str] = None
+        # None until the prefixes are looked up, an empty tuple if none matched
+        self._interwiki: Optional[Tuple[PrefixCallable, str]] = None
+
+    def _resolve_prefix(self) -> Tuple[PrefixCallable, str]:
+        if self._interwiki is None:
+            self._interwiki = self.prefixes.resolve(self.target) or ()  # type: ignore
+        return self._interwiki  # type: ignore
+
+    @property
+    def is_interwiki(self) -> bool:
+        return bool(self._resolve_prefix())
+
+    @property
+    def url(self) -> str:
+        if self._url is None:
+            self._url = self.make_url()
+        return self._url
+
     def make_url(self) -> str:
-        for prefix, func in PREFIXES.items():
-            if self.target.startswith(prefix + ":"):
-                return func(self.target[len(prefix) + 1:])
+        resolved = self._resolve_prefix()
+        if resolved:
+            func, page = resolved
+            return func(page)
 
         return self.wiki.url_to(self.target)
 
+    @property
+    def page(self) -> str:
+        """Title of the linked page without the section"""
+        return self.target.partition("#")[0]
+
+    def resolve(self, info: PageInfo) -> None:
+        """Points the link to the page it actually leads to on the wiki."""
+        _, hash, section = self.target.partition("#")
+        self.exists = info.exists
+        if info.exists:
+            self._url = self.wiki.url_to(info.title + hash + section)
+        else:
+            self._url = self.wiki.url_to(info.title, action="edit", redlink=1)
+
     def __repr__(self):
         return f"<Link target={self.target} title={self.title} url={self.url}>"
 
@@ -32,4 +70,4 @@ class Link:
         return f"[{self.title}](<{self.url}>)"
 
     def to_link(self) -> str:
-        return f"<{self.url}>"
\ No newline at end of file
+        return f"<{self.url}>"
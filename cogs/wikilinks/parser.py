@@ -0,0 +1,71 @@
+import re
+from typing import Iterable, Iterator, List, Match, Tuple
+
+WIKILINK_REGEX = re.compile(r"\[\[(.+?)(?:\|(.*?))?\]\]([^ `\n]+)?")
+CODEBLOCK_REGEX = re.compile(r"(`{1,3}).*?\1", re.DOTALL)
+
+CODE = "code"
+LINK = "link"
+
+
+def has_wikilink_candidates(text: str) -> bool:
+    """Cheap check that is run before anything else is done with a message.
+
+    It does not allocate and does not run any regex, so it is safe to call
+    for every message the bot sees. A positive result only means that the
+    text might contain wikilinks.
+    """
+    start = text.find("[[")
+    return start != -1 and text.find("]]", start + 3) != -1
+
+
+def tokenize(text: str) -> Iterator[Tuple[str, Match[str]]]:
+    """Yields codeblocks and wikilinks outside of them in the order they appear in the text.
+
+    Both regexes only ever move forward, so the whole text is scanned once no
+    matter how many links and codeblocks it has. A link is considered to be
+    within a codeblock if it lies strictly inside the last codeblock that
+    starts before it: codeblocks never overlap, so no other one can contain it.
+    """
+    codeblocks = CODEBLOCK_REGEX.finditer(text)
+    next_codeblock = next(codeblocks, None)
+    last_codeblock = None
+
+    for link in WIKILINK_REGEX.finditer(text):
+        while next_codeblock is not None and next_codeblock.start(0) < link.start(0):
+            yield CODE, next_codeblock
+            last_codeblock = next_codeblock
+            next_codeblock = next(codeblocks, None)
+
+        if last_codeblock is not None and link.end(0) < last_codeblock.end(0):
+            continue
+
+        yield LINK, link
+
+    if next_codeblock is not None:
+        yield CODE, next_codeblock
+        yield from ((CODE, codeblock) for codeblock in codeblocks)
+
+
+def find_wikilink_matches(text: str) -> List[Match[str]]:
+    """Returns matches of all wikilinks in the text that are not within codeblocks."""
+    if not has_wikilink_candidates(text):
+        return []
+
+    return [match for kind, match in tokenize(text) if kind == LINK]
+
+
+def substitute(text: str, replacements: Iterable[Tuple[int, int, str]]) -> str:
+    """Builds a new string with ``text[start:end]`` replaced for every ``(start, end, new)``.
+
+    Replacements must be ordered and must not overlap.
+    """
+    parts = []
+    position = 0
+    for start, end, new in replacements:
+        parts.append(text[position:start])
+        parts.append(new)
+        position = end
+    parts.append(text[position:])
+
+    return "".join(parts)
@@ -1,11 +1,16 @@
-from typing import Callable, Dict
+from typing import Callable, Dict, Mapping, Optional, Tuple
 from utils.wiki import Wiki
 
 PrefixCallable = Callable[[str], str]
 
 def wiki_link(url: str, delimiter: str = "_") -> PrefixCallable:
+    # The template is split once, so building a link is just a concatenation
+    head, placeholder, tail = url.partition("{page}")
+    if not placeholder:
+        return lambda page: url
+
     def get_url(page: str) -> str:
-        return url.format(page=page.replace(" ", delimiter))
+        return head + page.replace(" ", delimiter) + tail
 
     return get_url
 
@@ -15,6 +20,62 @@ def internal_wiki_link(link: str) -> str:
     return wiki.url_to(page)
 
 
+class PrefixIndex:
+    """Lookup table for interwiki prefixes.
+
+    Prefixes are matched case-insensitively and the longest matching prefix wins,
+    so ``w:ru:Page`` resolves to ``w:ru`` even if ``w`` is also known. An index may
+    have a parent which is consulted for the prefixes it does not define itself.
+    """
+
+    def __init__(self, prefixes: Mapping[str, PrefixCallable], parent: Optional["PrefixIndex"] = None):
+        self.parent = parent
+        self._table: Dict[str, PrefixCallable] = {
+            prefix.lower(): func
+            for prefix, func in prefixes.items()
+        }
+
+        # A prefix with n colons in it needs n + 1 colons in the target to match
+        self._depth = max((prefix.count(":") + 1 for prefix in self._table), default=0)
+        if parent is not None:
+            self._depth = max(self._depth, parent._depth)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def _get(self, prefix: str) -> Optional[PrefixCallable]:
+        func = self._table.get(prefix)
+        if func is None and self.parent is not None:
+            return self.parent._get(prefix)
+        return func
+
+    def resolve(self, target: str) -> Optional[Tuple[PrefixCallable, str]]:
+        """Returns the function for the longest prefix of target and the rest of the target."""
+        colons = []
+        position = target.find(":")
+        while position != -1 and len(colons) < self._depth:
+            colons.append(position)
+            position = target.find(":", position + 1)
+
+        for position in reversed(colons):
+            func = self._get(target[:position].lower())
+            if func is not None:
+                return func, target[position + 1:]
+
+        return None
+
+    @classmethod
+    def from_templates(cls, templates: Mapping[str, str], parent: Optional["PrefixIndex"] = None) -> "PrefixIndex":
+        """Builds an index from MediaWiki-style templates, where ``$1`` stands for the page name."""
+        return cls(
+            {
+                prefix: wiki_link(url.replace("$1", "{page}"))
+                for prefix, url in templates.items()
+            },
+            parent=parent
+        )
+
+
 PREFIXES: Dict[str, PrefixCallable] = {
     # Fandom
     "w:c":           internal_wiki_link,
@@ -44,4 +105,6 @@ PREFIXES: Dict[str, PrefixCallable] = {
     # Other
     "g":             wiki_link("https://google.com/search?q={page}", delimiter="+"),
     "google":        wiki_link("https://google.com/search?q={page}", delimiter="+"),
-}
\ No newline at end of file
+}
+
+INTERWIKI = PrefixIndex(PREFIXES)
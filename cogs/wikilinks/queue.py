@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+import discord
+
+T = TypeVar("T")
+
+log = logging.getLogger(__name__)
+
+
+class SendQueue(Generic[T]):
+    """Runs jobs one by one per channel, in the order they were submitted.
+
+    Every channel gets its own worker, which exits after ``idle_timeout`` seconds
+    without jobs. At most ``workers`` jobs run at the same time across all
+    channels. When Discord rate limits a channel, its worker waits once and
+    retries the job, so the following jobs do not each run into the limit.
+    A job that is still rate limited after ``max_retries`` retries is passed
+    to ``fallback``, if there is one.
+    A channel with ``max_depth`` jobs waiting does not accept any more.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[T], Awaitable[None]],
+        *,
+        workers: int = 16,
+        max_depth: int = 20,
+        idle_timeout: float = 60,
+        max_retries: int = 3,
+        fallback: Optional[Callable[[T], Awaitable[None]]] = None
+    ):
+        self.handler = handler
+        self.fallback = fallback
+        self.max_depth = max_depth
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+
+        self._slots = asyncio.Semaphore(workers)
+        self._queues: Dict[Hashable, asyncio.Queue[T]] = {}
+        self._workers: Dict[Hashable, asyncio.Task[None]] = {}
+        self._retry_at: Dict[Hashable, float] = {}
+
+        self.rejected = 0
+
+    def depth(self, key: Hashable) -> int:
+        queue = self._queues.get(key)
+        return 0 if queue is None else queue.qsize()
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs waiting across all channels."""
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    @property
+    def channels(self) -> int:
+        return len(self._queues)
+
+    def submit(self, key: Hashable, job: T) -> bool:
+        """Queues the job, returns False if the channel is too far behind to accept it."""
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+            self._workers[key] = asyncio.create_task(self._work(key, queue))
+        elif queue.qsize() >= self.max_depth:
+            self.rejected += 1
+            return False
+
+        queue.put_nowait(job)
+        return True
+
+    def close(self) -> None:
+        for worker in self._workers.values():
+            worker.cancel()
+
+    @staticmethod
+    def _retry_after(exc: discord.HTTPException) -> Optional[float]:
+        if exc.status != 429:
+            return None
+
+        try:
+            return float(exc.response.headers.get("Retry-After", 1))
+        except (AttributeError, ValueError):
+            return 1.0
+
+    async def _run(self, key: Hashable, job: T) -> None:
+        for _ in range(self.max_retries + 1):
+            if (delay := self._retry_at.pop(key, 0) - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+
+            try:
+                await self.handler(job)
+                return
+            except discord.HTTPException as exc:
+                retry_after = self._retry_after(exc)
+                if retry_after is None:
+                    raise
+                self._retry_at[key] = time.monotonic() + retry_after
+
+        if self.fallback is None:
+            log.warning("Dropping a job for %s, still rate limited after %d attempts", key, self.max_retries + 1)
+            return
+
+        log.warning("Giving up on a job for %s, still rate limited after %d attempts", key, self.max_retries + 1)
+        await self.fallback(job)
+
+    async def _next_job(self, queue: asyncio.Queue[T]) -> Optional[T]:
+        """Waits up to ``idle_timeout`` seconds for a job, returns None if none came."""
+        # Not wait_for: on Python 3.10 it loses the result of a get that finishes as it times out
+        get = asyncio.ensure_future(queue.get())
+        try:
+            done, _ = await asyncio.wait((get,), timeout=self.idle_timeout)
+        except asyncio.CancelledError:
+            get.cancel()
+            raise
+
+        if not done:
+            get.cancel()
+            await asyncio.wait((get,))
+            if get.cancelled():
+                return None
+        return get.result()
+
+    async def _work(self, key: Hashable, queue: asyncio.Queue[T]) -> None:
+        try:
+            while True:
+                job = await self._next_job(queue)
+                if job is None:
+                    # Nothing is awaited between the check and the removal,
+                    # so no job can be submitted to a queue without a worker
+                    if queue.empty():
+                        break
+                    continue
+
+                async with self._slots:
+                    try:
+                        await self._run(key, job)
+                    except Exception:
+                        log.exception("Failed to process a job for %s", key)
+        finally:
+            if self._queues.get(key) is queue:
+                del self._queues[key]
+                del self._workers[key]
+            self._retry_at.pop(key, None)
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, Iterable, Optional
+
+from utils.wiki import MAX_TITLES_PER_QUERY, PageInfo, Wiki
+
+
+class _Batch:
+    def __init__(self, wiki: Wiki):
+        self.wiki = wiki
+        self.futures: Dict[str, asyncio.Future[PageInfo]] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class TitleResolver:
+    """Resolves page titles in batches.
+
+    Titles requested for the same wiki within ``window`` seconds of each other
+    are resolved together, so that a burst of linked messages costs one API
+    call per MAX_TITLES_PER_QUERY titles rather than one per link.
+    """
+
+    def __init__(self, window: float = 0.1):
+        self.window = window
+        self._batches: Dict[str, _Batch] = {}
+
+    def _flush(self, url: str) -> None:
+        batch = self._batches.pop(url, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        asyncio.create_task(self._resolve(batch))
+
+    async def _resolve(self, batch: _Batch) -> None:
+        try:
+            result = await batch.wiki.query_titles(batch.futures)
+        except Exception as exc:
+            for future in batch.futures.values():
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for title, future in batch.futures.items():
+            if not future.done():
+                future.set_result(result[title])
+
+    async def resolve(self, wiki: Wiki, titles: Iterable[str]) -> Dict[str, PageInfo]:
+        assert wiki.url is not None
+        loop = asyncio.get_running_loop()
+
+        futures = {}
+        for title in titles:
+            batch = self._batches.get(wiki.url)
+            if batch is None:
+                batch = self._batches[wiki.url] = _Batch(wiki)
+                batch.timer = loop.call_later(self.window, self._flush, wiki.url)
+
+            future = batch.futures.get(title)
+            if future is None:
+                future = batch.futures[title] = loop.create_future()
+            futures[title] = future
+
+            if len(batch.futures) >= MAX_TITLES_PER_QUERY:
+                self._flush(wiki.url)
+
+        results = await asyncio.gather(*futures.values())
+        return dict(zip(futures, results))
@@ -1,38 +1,203 @@
+"""
+Compiles config-default.yml, config.yml and resources/strings.yml into read-only objects.
+
+The classes below describe what the files must contain. Every section is checked
+against them once, when the files are loaded, so a missing or mistyped value
+stops the bot at startup instead of raising somewhere in a command. Sections
+become instances of slotted classes, lists become tuples and mappings without
+a fixed set of keys become read-only mappings.
+
+``config`` and ``strings`` point to the current snapshot, which ``reload``
+and ``swap`` replace as a whole. Values that were read at startup (pool sizes,
+intervals of the background tasks and so on) keep their old values until a restart.
+"""
+
 from pathlib import Path
-from typing import List
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Tuple, Type, Union, get_args, get_origin, get_type_hints
 
 import yaml
 
-class _BotConfigImpl:
-
-    def __init__(self, data):
-        self.data = data
-    
-    def __getattr__(self, name):
-        ret = self.data[name]
-        
-        if type(ret) == dict:
-            ret = _BotConfigImpl(ret)
-
-        return ret
-
-    def update(self, new):
-        for name, value in new.items():
-            if type(value) == dict:
-                _BotConfigImpl(self.data[name]).update(value)
-            else:
-                self.data[name] = value
-    
+
+class ConfigError(Exception):
+    """The configuration files do not match the schema."""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        super().__init__("Invalid configuration:\n" + "\n".join(f"  {problem}" for problem in problems))
+
+
+class Section:
+    """A read-only section of a configuration file."""
+
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __iter__(self):
+        for name in self.__slots__:
+            yield name, getattr(self, name)
+
+    def __repr__(self) -> str:
+        return "{}({})".format(type(self).__name__, ", ".join(f"{name}={value!r}" for name, value in self))
+
+
+_section_classes: Dict[Tuple[str, Tuple[str, ...]], Type[Section]] = {}
+
+
+def _section_class(name: str, fields: Tuple[str, ...]) -> Type[Section]:
+    key = (name, fields)
+    cls = _section_classes.get(key)
+    if cls is None:
+        cls = _section_classes[key] = type(name, (Section,), {"__slots__": fields})
+    return cls
+
+
+def _compile(value: Any, schema: Any, path: str, problems: List[str]) -> Any:
+    """Checks the value against the schema and turns it into its read-only form."""
+    origin = get_origin(schema)
+    if origin is Union:
+        options = get_args(schema)
+        if value is None and type(None) in options:
+            return None
+        schema = next(option for option in options if option is not type(None))
+        origin = get_origin(schema)
+
+    if schema is Any:
+        return _compile_any(value, path)
+
+    if origin is list:
+        if not isinstance(value, list):
+            problems.append(f"{path}: expected a list, got {value!r}")
+            return None
+        (item_schema,) = get_args(schema)
+        return tuple(_compile(item, item_schema, f"{path}[{i}]", problems) for i, item in enumerate(value))
+
+    if origin is dict:
+        if not isinstance(value, dict):
+            problems.append(f"{path}: expected a mapping, got {value!r}")
+            return None
+        _, item_schema = get_args(schema)
+        return MappingProxyType({
+            key: _compile(item, item_schema, f"{path}.{key}", problems) for key, item in value.items()
+        })
+
+    if schema is float:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            problems.append(f"{path}: expected a number, got {value!r}")
+            return None
+        return float(value)
+
+    if schema in (int, str, bool):
+        # bool is a subclass of int, but true is never meant as 1 here
+        if not isinstance(value, schema) or (schema is int and isinstance(value, bool)):
+            problems.append(f"{path}: expected {schema.__name__}, got {value!r}")
+            return None
+        return value
+
+    # One of the classes describing a section
+    if not isinstance(value, dict):
+        problems.append(f"{path}: expected a section, got {value!r}")
+        return None
+
+    hints = get_type_hints(schema)
+    values = {}
+    for name, hint in hints.items():
+        if name not in value:
+            problems.append(f"{path}.{name} is missing")
+            continue
+        values[name] = _compile(value[name], hint, f"{path}.{name}", problems)
+    for name in value.keys() - hints.keys():
+        problems.append(f"{path}.{name} is not a known setting")
+
+    section = _section_class(schema.__name__, tuple(values))()
+    for name, item in values.items():
+        object.__setattr__(section, name, item)
+    return section
+
+
+def _compile_any(value: Any, path: str) -> Any:
+    if isinstance(value, list):
+        return tuple(_compile_any(item, f"{path}[{i}]") for i, item in enumerate(value))
+    if isinstance(value, dict):
+        return MappingProxyType({key: _compile_any(item, f"{path}.{key}") for key, item in value.items()})
+    return value
+
+
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(base)
+    for name, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(name), dict):
+            merged[name] = _merge(merged[name], value)
+        else:
+            merged[name] = value
+    return merged
+
+
+def _read(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def compile_files() -> Tuple["BotConfig", "BotStrings"]:
+    """Reads and checks the configuration files, raises ConfigError listing everything wrong with them."""
+    data = _read("config-default.yml")
+    if Path("config.yml").exists():
+        data = _merge(data, _read("config.yml"))
+
+    problems: List[str] = []
+    compiled_config = _compile(data, BotConfig, "config", problems)
+    compiled_strings = _compile(_read("resources/strings.yml"), BotStrings, "strings", problems)
+    if problems:
+        raise ConfigError(problems)
+    return compiled_config, compiled_strings
+
+
+class _Snapshot:
+    """Forwards attribute access to the current compiled object."""
+
+    __slots__ = ("_target",)
+
+    def __init__(self, target: Any):
+        object.__setattr__(self, "_target", target)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("The configuration is read-only, change the files and reload it")
+
     def __iter__(self):
-        for name, value in self.data.items():
-            if type(value) == dict:
-                yield name, _BotConfigImpl(value)
-            else:
-                yield name, value
+        return iter(self._target)
+
+    def __repr__(self) -> str:
+        return repr(self._target)
+
+
+def swap(compiled_config: "BotConfig", compiled_strings: "BotStrings") -> None:
+    """Makes ``config`` and ``strings`` point to the given snapshot."""
+    # Nothing can run in between, so no one sees the new config with the old strings
+    object.__setattr__(config, "_target", compiled_config)
+    object.__setattr__(strings, "_target", compiled_strings)
+
+
+def reload() -> None:
+    """Reads the configuration files again and replaces ``config`` and ``strings`` together.
+
+    If the files are invalid, ConfigError is raised and the current values stay.
+    The files are read synchronously, a running bot should call ``compile_files``
+    in a thread and ``swap`` the result instead.
+    """
+    swap(*compile_files())
+
 
 # These are provided to make type checker happy
 
-class BotConfig(_BotConfigImpl):
+class BotConfig:
     default_prefix: str
     description: str
     primary_color: int
@@ -41,11 +206,105 @@ class BotConfig(_BotConfigImpl):
     credentials: "BotCredentials"
     test_guilds: List[int]
     debug: bool
+    command_sync: "CommandSyncConfig"
     cogs: List[str]
+    lazy_cogs: Dict[str, List[str]]
+    pool: "PoolConfig"
+    sharding: "ShardingConfig"
+    settings_cache: "SettingsCacheConfig"
+    wiki_client: "WikiClientConfig"
+    wiki_cache: "WikiCacheConfig"
+    autocomplete: "AutocompleteConfig"
+    wiki_directory: "WikiDirectoryConfig"
+    wikilinks: "WikilinksConfig"
+    metrics: "MetricsConfig"
+    profiler: "ProfilerConfig"
+    feeds: "FeedsConfig"
 
 class BotCredentials:
     token: str
 
+class PoolConfig:
+    min_size: int
+    max_size: int
+
+class ShardingConfig:
+    clusters: int
+    shard_count: Optional[int]
+    health_interval: float
+    restart_delay: float
+    max_restart_delay: float
+
+class MetricsConfig:
+    enabled: bool
+    host: str
+    port: int
+    loop_lag_interval: float
+
+class ProfilerConfig:
+    enabled: bool
+    sample_interval: float
+    block_threshold: float
+    max_stacks: int
+    history: int
+
+class CommandSyncConfig:
+    on_startup: bool
+
+class SettingsCacheConfig:
+    max_size: int
+    ttl: Optional[float]
+
+class WikiClientConfig:
+    connections_per_host: int
+    requests_per_second: float
+    burst: int
+    timeout: float
+    retries: int
+    backoff_base: float
+    backoff_max: float
+    maxlag: Optional[int]
+    breaker_threshold: int
+    breaker_cooldown: float
+
+class WikiCacheConfig:
+    max_bytes: int
+    stale_ttl: float
+    path: Optional[str]
+    ttls: Dict[str, float]
+
+class AutocompleteConfig:
+    deadline: float
+    cache_size: int
+    ttl: Optional[float]
+
+class WikiDirectoryConfig:
+    refresh_interval: float
+    refresh_limit: int
+
+class WikilinksConfig:
+    verify_window: float
+    verify_timeout: float
+    attachment_budget: int
+    attachment_spool_threshold: int
+    queue_workers: int
+    queue_max_depth: int
+    queue_idle_timeout: float
+
+class FeedsConfig:
+    min_interval: float
+    max_interval: float
+    target_batch: int
+    limit: int
+    outbox: "FeedOutboxConfig"
+
+class FeedOutboxConfig:
+    flush_window: float
+    max_pending: int
+    channel_rate: float
+    channel_burst: int
+    global_rate: float
+
 class BotEmojis:
     success: str
     error: str
@@ -54,12 +313,29 @@ class BotEmojis:
     disabled: str
 
 
-with open("config-default.yml") as f:
-    config = BotConfig(yaml.safe_load(f))
+class BotStrings:
+    config: "ConfigStrings"
+
+class ConfigStrings:
+    heading: str
+    beta_features_menu: "BetaFeaturesStrings"
+
+class BetaFeaturesStrings:
+    name: str
+    description: str
+    availible_features_title: str
+    availible_features: List["FeatureStrings"]
+    manage_features: str
+    choose_features: str
+    feature_list_updated: str
+    access_denied: str
+
+class FeatureStrings:
+    flag_name: str
+    name: str
+    description: str
 
-if Path("config.yml").exists():
-    with open("config.yml") as f:
-        config.update(yaml.safe_load(f))
 
-with open("resources/strings.yml") as f:
-    strings = _BotConfigImpl(yaml.safe_load(f))
+config: BotConfig = _Snapshot(None)  # type: ignore
+strings: BotStrings = _Snapshot(None)  # type: ignore
+reload()
@@ -0,0 +1,10 @@
+-- migrate:up
+CREATE TABLE wh_interwiki_prefixes (
+    guild_id bigint NOT NULL,
+    prefix text NOT NULL,
+    url text NOT NULL,
+    PRIMARY KEY (guild_id, prefix)
+);
+
+-- migrate:down
+DROP TABLE wh_interwiki_prefixes;
@@ -0,0 +1,9 @@
+-- migrate:up
+CREATE TABLE wh_known_wikis (
+    url text PRIMARY KEY,
+    name text NOT NULL,
+    last_seen timestamp with time zone DEFAULT now()
+);
+
+-- migrate:down
+DROP TABLE wh_known_wikis;
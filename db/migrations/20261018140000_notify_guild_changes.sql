@@ -0,0 +1,20 @@
+-- migrate:up
+CREATE FUNCTION wh_guilds_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('wh_guilds_changed', json_build_object('op', TG_OP, 'id', OLD.id)::text);
+        RETURN OLD;
+    END IF;
+
+    PERFORM pg_notify('wh_guilds_changed', json_build_object('op', TG_OP, 'id', NEW.id, 'row', row_to_json(NEW))::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER wh_guilds_changed
+AFTER INSERT OR UPDATE OR DELETE ON wh_guilds
+FOR EACH ROW EXECUTE FUNCTION wh_guilds_notify();
+
+-- migrate:down
+DROP TRIGGER wh_guilds_changed ON wh_guilds;
+DROP FUNCTION wh_guilds_notify();
@@ -0,0 +1,21 @@
+-- migrate:up
+CREATE TABLE wh_feed_subscriptions (
+    channel_id bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    wiki_url text NOT NULL,
+    created_at timestamp with time zone DEFAULT now(),
+    PRIMARY KEY (channel_id, wiki_url)
+);
+
+CREATE INDEX wh_feed_subscriptions_wiki_url_idx ON wh_feed_subscriptions (wiki_url);
+
+-- Where the poller of every wiki has stopped, so that a restart neither skips nor repeats edits
+CREATE TABLE wh_feed_positions (
+    wiki_url text PRIMARY KEY,
+    last_rcid bigint NOT NULL,
+    last_timestamp text NOT NULL
+);
+
+-- migrate:down
+DROP TABLE wh_feed_positions;
+DROP TABLE wh_feed_subscriptions;
@@ -0,0 +1,13 @@
+-- migrate:up
+-- Feed items that have not been delivered yet, so that a restart does not lose them
+CREATE TABLE wh_feed_outbox (
+    channel_id bigint NOT NULL,
+    wiki_url text NOT NULL,
+    rcid bigint NOT NULL,
+    change jsonb NOT NULL,
+    created_at timestamp with time zone DEFAULT now(),
+    PRIMARY KEY (channel_id, wiki_url, rcid)
+);
+
+-- migrate:down
+DROP TABLE wh_feed_outbox;
@@ -0,0 +1,13 @@
+-- migrate:up
+-- What was last synced to Discord for every application command scope, guild_id is 0 for global commands
+CREATE TABLE wh_command_sync (
+    application_id bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    hash text NOT NULL,
+    payload jsonb NOT NULL,
+    synced_at timestamp with time zone DEFAULT now(),
+    PRIMARY KEY (application_id, guild_id)
+);
+
+-- migrate:down
+DROP TABLE wh_command_sync;
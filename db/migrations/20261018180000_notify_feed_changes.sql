@@ -0,0 +1,25 @@
+-- migrate:up
+-- Every process keeps the subscriptions of all guilds, the poller of a wiki might run in another one
+CREATE FUNCTION wh_feed_subscriptions_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('wh_feed_subscriptions_changed', json_build_object(
+            'op', TG_OP, 'guild_id', OLD.guild_id, 'channel_id', OLD.channel_id, 'wiki_url', OLD.wiki_url
+        )::text);
+        RETURN OLD;
+    END IF;
+
+    PERFORM pg_notify('wh_feed_subscriptions_changed', json_build_object(
+        'op', TG_OP, 'guild_id', NEW.guild_id, 'channel_id', NEW.channel_id, 'wiki_url', NEW.wiki_url
+    )::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER wh_feed_subscriptions_changed
+AFTER INSERT OR DELETE ON wh_feed_subscriptions
+FOR EACH ROW EXECUTE FUNCTION wh_feed_subscriptions_notify();
+
+-- migrate:down
+DROP TRIGGER wh_feed_subscriptions_changed ON wh_feed_subscriptions;
+DROP FUNCTION wh_feed_subscriptions_notify();
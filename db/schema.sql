@@ -9,6 +9,48 @@ SET xmloption = content;
 SET client_min_messages = warning;
 SET row_security = off;
 
+--
+-- Name: wh_feed_subscriptions_notify(); Type: FUNCTION; Schema: public; Owner: -
+--
+
+CREATE FUNCTION public.wh_feed_subscriptions_notify() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('wh_feed_subscriptions_changed', json_build_object(
+            'op', TG_OP, 'guild_id', OLD.guild_id, 'channel_id', OLD.channel_id, 'wiki_url', OLD.wiki_url
+        )::text);
+        RETURN OLD;
+    END IF;
+
+    PERFORM pg_notify('wh_feed_subscriptions_changed', json_build_object(
+        'op', TG_OP, 'guild_id', NEW.guild_id, 'channel_id', NEW.channel_id, 'wiki_url', NEW.wiki_url
+    )::text);
+    RETURN NEW;
+END;
+$$;
+
+
+--
+-- Name: wh_guilds_notify(); Type: FUNCTION; Schema: public; Owner: -
+--
+
+CREATE FUNCTION public.wh_guilds_notify() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('wh_guilds_changed', json_build_object('op', TG_OP, 'id', OLD.id)::text);
+        RETURN OLD;
+    END IF;
+
+    PERFORM pg_notify('wh_guilds_changed', json_build_object('op', TG_OP, 'id', NEW.id, 'row', row_to_json(NEW))::text);
+    RETURN NEW;
+END;
+$$;
+
+
 SET default_tablespace = '';
 
 SET default_table_access_method = heap;
@@ -22,6 +64,55 @@ CREATE TABLE public.schema_migrations (
 );
 
 
+--
+-- Name: wh_command_sync; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.wh_command_sync (
+    application_id bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    hash text NOT NULL,
+    payload jsonb NOT NULL,
+    synced_at timestamp with time zone DEFAULT now()
+);
+
+
+--
+-- Name: wh_feed_outbox; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.wh_feed_outbox (
+    channel_id bigint NOT NULL,
+    wiki_url text NOT NULL,
+    rcid bigint NOT NULL,
+    change jsonb NOT NULL,
+    created_at timestamp with time zone DEFAULT now()
+);
+
+
+--
+-- Name: wh_feed_positions; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.wh_feed_positions (
+    wiki_url text NOT NULL,
+    last_rcid bigint NOT NULL,
+    last_timestamp text NOT NULL
+);
+
+
+--
+-- Name: wh_feed_subscriptions; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.wh_feed_subscriptions (
+    channel_id bigint NOT NULL,
+    guild_id bigint NOT NULL,
+    wiki_url text NOT NULL,
+    created_at timestamp with time zone DEFAULT now()
+);
+
+
 --
 -- Name: wh_guilds; Type: TABLE; Schema: public; Owner: -
 --
@@ -35,6 +126,28 @@ CREATE TABLE public.wh_guilds (
 );
 
 
+--
+-- Name: wh_interwiki_prefixes; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.wh_interwiki_prefixes (
+    guild_id bigint NOT NULL,
+    prefix text NOT NULL,
+    url text NOT NULL
+);
+
+
+--
+-- Name: wh_known_wikis; Type: TABLE; Schema: public; Owner: -
+--
+
+CREATE TABLE public.wh_known_wikis (
+    url text NOT NULL,
+    name text NOT NULL,
+    last_seen timestamp with time zone DEFAULT now()
+);
+
+
 --
 -- Name: wh_wikilink_webhooks; Type: TABLE; Schema: public; Owner: -
 --
@@ -53,6 +166,38 @@ ALTER TABLE ONLY public.schema_migrations
     ADD CONSTRAINT schema_migrations_pkey PRIMARY KEY (version);
 
 
+--
+-- Name: wh_command_sync wh_command_sync_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.wh_command_sync
+    ADD CONSTRAINT wh_command_sync_pkey PRIMARY KEY (application_id, guild_id);
+
+
+--
+-- Name: wh_feed_outbox wh_feed_outbox_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.wh_feed_outbox
+    ADD CONSTRAINT wh_feed_outbox_pkey PRIMARY KEY (channel_id, wiki_url, rcid);
+
+
+--
+-- Name: wh_feed_positions wh_feed_positions_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.wh_feed_positions
+    ADD CONSTRAINT wh_feed_positions_pkey PRIMARY KEY (wiki_url);
+
+
+--
+-- Name: wh_feed_subscriptions wh_feed_subscriptions_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.wh_feed_subscriptions
+    ADD CONSTRAINT wh_feed_subscriptions_pkey PRIMARY KEY (channel_id, wiki_url);
+
+
 --
 -- Name: wh_guilds wh_guilds_pkey; Type: CONSTRAINT; Schema: public; Owner: -
 --
@@ -61,6 +206,22 @@ ALTER TABLE ONLY public.wh_guilds
     ADD CONSTRAINT wh_guilds_pkey PRIMARY KEY (id);
 
 
+--
+-- Name: wh_interwiki_prefixes wh_interwiki_prefixes_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.wh_interwiki_prefixes
+    ADD CONSTRAINT wh_interwiki_prefixes_pkey PRIMARY KEY (guild_id, prefix);
+
+
+--
+-- Name: wh_known_wikis wh_known_wikis_pkey; Type: CONSTRAINT; Schema: public; Owner: -
+--
+
+ALTER TABLE ONLY public.wh_known_wikis
+    ADD CONSTRAINT wh_known_wikis_pkey PRIMARY KEY (url);
+
+
 --
 -- Name: wh_wikilink_webhooks wh_wikilink_webhooks_pkey; Type: CONSTRAINT; Schema: public; Owner: -
 --
@@ -69,6 +230,27 @@ ALTER TABLE ONLY public.wh_wikilink_webhooks
     ADD CONSTRAINT wh_wikilink_webhooks_pkey PRIMARY KEY (channel_id);
 
 
+--
+-- Name: wh_feed_subscriptions_wiki_url_idx; Type: INDEX; Schema: public; Owner: -
+--
+
+CREATE INDEX wh_feed_subscriptions_wiki_url_idx ON public.wh_feed_subscriptions USING btree (wiki_url);
+
+
+--
+-- Name: wh_feed_subscriptions wh_feed_subscriptions_changed; Type: TRIGGER; Schema: public; Owner: -
+--
+
+CREATE TRIGGER wh_feed_subscriptions_changed AFTER INSERT OR DELETE ON public.wh_feed_subscriptions FOR EACH ROW EXECUTE FUNCTION public.wh_feed_subscriptions_notify();
+
+
+--
+-- Name: wh_guilds wh_guilds_changed; Type: TRIGGER; Schema: public; Owner: -
+--
+
+CREATE TRIGGER wh_guilds_changed AFTER INSERT OR DELETE OR UPDATE ON public.wh_guilds FOR EACH ROW EXECUTE FUNCTION public.wh_guilds_notify();
+
+
 --
 -- PostgreSQL database dump complete
 --
@@ -83,4 +265,11 @@ INSERT INTO public.schema_migrations (version) VALUES
     ('20211006194734'),
     ('20211222113737'),
     ('20211226164418'),
-    ('20221023182737');
+    ('20221023182737'),
+    ('20261018120000'),
+    ('20261018130000'),
+    ('20261018140000'),
+    ('20261018150000'),
+    ('20261018160000'),
+    ('20261018170000'),
+    ('20261018180000');
@@ -0,0 +1,227 @@
+"""
+Runs the bot in several processes ("clusters"), each one handling a slice of the shards.
+
+The supervisor restarts clusters that crash and periodically logs their combined health.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import config
+
+log = logging.getLogger("launcher")
+
+
+@dataclass
+class ClusterHealth:
+    cluster_id: int
+    pid: int
+    guilds: int
+    latencies: Dict[int, float]
+    reported_at: float = field(default_factory=time.time)
+
+
+def fetch_shard_count(token: str) -> int:
+    """Asks Discord how many shards the bot should be using."""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "Whitespace launcher"}
+    )
+    with urllib.request.urlopen(request, timeout=30) as resp:
+        return json.load(resp)["shards"]
+
+
+def run_cluster(
+    cluster_id: int,
+    cluster_count: int,
+    shard_ids: List[int],
+    shard_count: int,
+    health: "multiprocessing.Queue[ClusterHealth]"
+) -> None:
+    """Entry point of a cluster process."""
+    import discord
+    from bot import Bot
+
+    discord.utils.setup_logging()
+    bot = Bot(shard_ids=shard_ids, shard_count=shard_count, cluster_id=cluster_id, cluster_count=cluster_count)
+
+    async def report_health() -> None:
+        await bot.wait_until_ready()
+        while not bot.is_closed():
+            health.put(ClusterHealth(
+                cluster_id=cluster_id,
+                pid=os.getpid(),
+                guilds=len(bot.guilds),
+                latencies={shard_id: latency for shard_id, latency in bot.latencies}
+            ))
+            await asyncio.sleep(config.sharding.health_interval)
+
+    async def main() -> None:
+        # The supervisor stops clusters with SIGTERM, which would otherwise kill the process
+        # without closing the pool, the listener or the tasks still sending messages
+        closing: List["asyncio.Task[None]"] = []
+
+        def shutdown() -> None:
+            if not closing:
+                closing.append(asyncio.create_task(bot.close()))
+
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, shutdown)
+        loop.add_signal_handler(signal.SIGINT, shutdown)
+
+        async with bot:
+            health_task = asyncio.create_task(report_health())
+            await bot.start(config.credentials.token)
+            health_task.cancel()
+
+    asyncio.run(main())
+
+
+class Cluster:
+    def __init__(self, cluster_id: int, cluster_count: int, shard_ids: List[int], shard_count: int):
+        self.id = cluster_id
+        self.cluster_count = cluster_count
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process: Optional[multiprocessing.Process] = None
+        self.crashes = 0
+        self.restart_at: Optional[float] = None
+        self.started_at = 0.0
+        self.health: Optional[ClusterHealth] = None
+
+    def start(self, context, health: "multiprocessing.Queue[ClusterHealth]") -> None:
+        self.process = context.Process(
+            target=run_cluster,
+            args=(self.id, self.cluster_count, self.shard_ids, self.shard_count, health),
+            name=f"cluster-{self.id}",
+            daemon=True
+        )
+        self.process.start()
+        self.started_at = time.monotonic()
+        self.restart_at = None
+        log.info("Started cluster %d (pid %d) with shards %s", self.id, self.process.pid, self.shard_ids)
+
+    @property
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+
+class Supervisor:
+    def __init__(self, clusters: int, shard_count: int):
+        self.context = multiprocessing.get_context("spawn")
+        self.health: "multiprocessing.Queue[ClusterHealth]" = self.context.Queue()
+        self.clusters = [
+            Cluster(cluster_id, clusters, list(range(shard_count))[cluster_id::clusters], shard_count)
+            for cluster_id in range(clusters)
+        ]
+        self._stopping = False
+
+    def stop(self, *_) -> None:
+        self._stopping = True
+
+    def _drain_health(self) -> None:
+        while True:
+            try:
+                report = self.health.get_nowait()
+            except queue.Empty:
+                return
+            self.clusters[report.cluster_id].health = report
+
+    def _check_clusters(self) -> None:
+        now = time.monotonic()
+        for cluster in self.clusters:
+            if cluster.process is None:
+                # Not started yet
+                continue
+            if cluster.is_alive:
+                # A cluster that has been up for a while is not crash-looping anymore
+                if cluster.crashes and now - cluster.started_at > config.sharding.max_restart_delay:
+                    cluster.crashes = 0
+                continue
+
+            if cluster.restart_at is None:
+                exitcode = cluster.process.exitcode if cluster.process else None
+                delay = min(
+                    config.sharding.restart_delay * 2 ** cluster.crashes,
+                    config.sharding.max_restart_delay
+                )
+                cluster.crashes += 1
+                cluster.health = None
+                cluster.restart_at = now + delay
+                log.warning("Cluster %d exited with code %s, restarting in %.0fs", cluster.id, exitcode, delay)
+            elif now >= cluster.restart_at:
+                cluster.start(self.context, self.health)
+
+    def _log_health(self) -> None:
+        reports = [cluster.health for cluster in self.clusters if cluster.health is not None]
+        latencies = [latency for report in reports for latency in report.latencies.values()]
+        log.info(
+            "%d/%d clusters up, %d guilds, %d shards reporting, average latency %.0f ms",
+            sum(cluster.is_alive for cluster in self.clusters),
+            len(self.clusters),
+            sum(report.guilds for report in reports),
+            len(latencies),
+            sum(latencies) / len(latencies) * 1000 if latencies else 0
+        )
+
+    def _supervise(self, until: Optional[float], next_report: float) -> float:
+        """Looks after the started clusters until the time comes or the supervisor is stopped.
+
+        Returns when the next health report is due.
+        """
+        while not self._stopping and (until is None or time.monotonic() < until):
+            self._drain_health()
+            self._check_clusters()
+            if time.monotonic() >= next_report:
+                self._log_health()
+                next_report += config.sharding.health_interval
+            time.sleep(1 if until is None else min(1, max(until - time.monotonic(), 0)))
+        return next_report
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        next_report = time.monotonic() + config.sharding.health_interval
+        for cluster in self.clusters:
+            if self._stopping:
+                break
+            cluster.start(self.context, self.health)
+            # Discord only allows identifying a shard every few seconds
+            next_report = self._supervise(time.monotonic() + 5 * len(cluster.shard_ids), next_report)
+
+        self._supervise(None, next_report)
+
+        log.info("Shutting down")
+        for cluster in self.clusters:
+            if cluster.process is not None and cluster.process.is_alive():
+                cluster.process.terminate()
+        for cluster in self.clusters:
+            if cluster.process is not None:
+                cluster.process.join(timeout=30)
+                if cluster.process.is_alive():
+                    log.warning("Cluster %d did not shut down in time, killing it", cluster.id)
+                    cluster.process.kill()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(levelname)s] %(name)s: %(message)s")
+
+    shard_count = config.sharding.shard_count or fetch_shard_count(config.credentials.token)
+    clusters = max(1, min(config.sharding.clusters, shard_count))
+    log.info("Running %d shards in %d clusters", shard_count, clusters)
+
+    Supervisor(clusters, shard_count).run()
+
+
+if __name__ == "__main__":
+    main()
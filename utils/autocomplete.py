@@ -0,0 +1,114 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from discord import app_commands
+
+from .cache import TTLCache
+
+Choices = List[app_commands.Choice[str]]
+Fetcher = Callable[[], Awaitable[Tuple[Choices, bool]]]
+
+
+class AutocompleteEngine:
+    """Answers autocomplete requests from previous results whenever possible.
+
+    Results are cached per scope (e.g. a wiki) and query. When the results for
+    a shorter query were complete, i.e. the source returned less than it could,
+    the results for a longer query are computed locally by filtering them.
+
+    Only the latest keystroke of every user is waited for: when a newer request
+    from the same user arrives, the older one gives up immediately. The lookup
+    itself keeps running in the background, so its results still end up in the
+    cache. If a lookup does not finish in time, whatever the cache has is returned.
+    """
+
+    def __init__(self, *, maxsize: int = 4096, ttl: Optional[float] = 300):
+        self._results: TTLCache[Tuple[str, str], Tuple[Choices, bool]] = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._waiters: Dict[Hashable, asyncio.Event] = {}
+        self._lookups: Dict[Tuple[str, str], "asyncio.Task[Tuple[Choices, bool]]"] = {}
+
+        self.timeouts = 0
+        self.abandoned = 0
+
+    @classmethod
+    def from_config(cls, config) -> "AutocompleteEngine":
+        return cls(maxsize=config.cache_size, ttl=config.ttl)
+
+    @staticmethod
+    def _filter(choices: Choices, query: str) -> Choices:
+        return [choice for choice in choices if query in choice.name.casefold()]
+
+    def _local(self, scope: str, query: str, *, complete_only: bool) -> Optional[Choices]:
+        """Finds results for the longest cached prefix of the query."""
+        for end in range(len(query) - 1, -1, -1):
+            cached = self._results.peek((scope, query[:end]))
+            if cached is None:
+                continue
+
+            choices, complete = cached
+            if complete_only and not complete:
+                return None
+
+            return self._filter(choices, query)
+
+        return None
+
+    def _start_lookup(self, key: Tuple[str, str], fetch: Fetcher) -> "asyncio.Task[Tuple[Choices, bool]]":
+        task = self._lookups.get(key)
+        if task is not None:
+            return task
+
+        task = asyncio.ensure_future(fetch())
+        self._lookups[key] = task
+
+        def done(task: "asyncio.Task[Tuple[Choices, bool]]") -> None:
+            del self._lookups[key]
+            if not task.cancelled() and task.exception() is None:
+                self._results.set(key, task.result())
+
+        task.add_done_callback(done)
+        return task
+
+    async def complete(self, scope: str, query: str, fetch: Fetcher, *, user: Hashable, timeout: float) -> Choices:
+        """Returns choices for the query.
+
+        ``fetch`` is called to get fresh results when they cannot be derived from
+        the cache. It should return the choices and whether they are complete.
+        """
+        query = query.casefold()
+        key = (scope, query)
+
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached[0]
+
+        local = self._local(scope, query, complete_only=True)
+        if local is not None:
+            self._results.set(key, (local, True))
+            return local
+
+        previous = self._waiters.pop(user, None)
+        if previous is not None:
+            previous.set()
+
+        superseded = self._waiters[user] = asyncio.Event()
+        lookup = self._start_lookup(key, fetch)
+        waiter = asyncio.ensure_future(superseded.wait())
+        try:
+            await asyncio.wait({lookup, waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if self._waiters.get(user) is superseded:
+                del self._waiters[user]
+
+        if lookup.done() and not lookup.cancelled() and lookup.exception() is None:
+            return lookup.result()[0]
+
+        if superseded.is_set():
+            # Discord only shows the response to the latest keystroke anyway
+            self.abandoned += 1
+            return []
+
+        if not lookup.done():
+            self.timeouts += 1
+        return self._local(scope, query, complete_only=False) or []
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Iterator, Mapping, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+log = logging.getLogger(__name__)
+
+
+class TTLCache(Generic[K, V]):
+    """In-memory mapping with LRU eviction and per-entry expiry.
+
+    ``ttl`` of ``None`` disables expiry, entries are then only evicted
+    when the cache grows past ``maxsize``.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self._lookup(key) is not None
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(list(self._data))
+
+    def _lookup(self, key: K) -> Optional[Tuple[float, V]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+
+        if entry[0] < time.monotonic():
+            del self._data[key]
+            return None
+
+        return entry
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def peek(self, key: K) -> Optional[V]:
+        """Returns the value without touching LRU order or the counters."""
+        entry = self._lookup(key)
+        return None if entry is None else entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class _Response:
+    __slots__ = ("value", "size", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, size: int, fresh_until: float, stale_until: float):
+        self.value = value
+        self.size = size
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class ResponseCache:
+    """Cache for decoded API responses.
+
+    Only endpoints that have a TTL configured are cached. The in-memory part is
+    bounded by the approximate size of the responses in bytes and evicts the
+    least recently used ones first. Expired responses can still be served for
+    ``stale_ttl`` more seconds while they are being refreshed in the background.
+
+    If ``path`` is given, responses are also written to an SQLite database,
+    so that the cache survives restarts.
+    """
+
+    def __init__(
+        self,
+        ttls: Mapping[str, float],
+        *,
+        max_bytes: int = 32 * 1024 * 1024,
+        stale_ttl: float = 0,
+        path: Optional[str] = None
+    ):
+        self.ttls = dict(ttls)
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.size = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+        self._data: "OrderedDict[str, _Response]" = OrderedDict()
+        self._refreshing: Dict[str, "asyncio.Task[Any]"] = {}
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, value TEXT NOT NULL, fresh_until REAL NOT NULL, stale_until REAL NOT NULL)"
+                )
+                self._db.execute("DELETE FROM responses WHERE stale_until < ?", (time.time(),))
+
+    @classmethod
+    def from_config(cls, config) -> "ResponseCache":
+        return cls(
+            dict(config.ttls),
+            max_bytes=config.max_bytes,
+            stale_ttl=config.stale_ttl,
+            path=config.path
+        )
+
+    def caches(self, endpoint: Optional[str]) -> bool:
+        return endpoint is not None and endpoint in self.ttls
+
+    def close(self) -> None:
+        for task in self._refreshing.values():
+            task.cancel()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: str, response: _Response) -> None:
+        old = self._data.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+
+        if response.size > self.max_bytes:
+            return
+
+        self._data[key] = response
+        self.size += response.size
+        while self.size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= evicted.size
+
+    def _disk_get(self, key: str) -> Optional[Tuple[str, float, float]]:
+        assert self._db is not None
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT value, fresh_until, stale_until FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _disk_set(self, key: str, value: str, response: _Response) -> None:
+        assert self._db is not None
+        with self._db_lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, value, response.fresh_until, response.stale_until)
+            )
+
+    async def _lookup(self, key: str) -> Optional[_Response]:
+        response = self._data.get(key)
+        if response is not None:
+            self._data.move_to_end(key)
+            return response
+
+        if self._db is None:
+            return None
+
+        row = await asyncio.to_thread(self._disk_get, key)
+        if row is None:
+            return None
+
+        value, fresh_until, stale_until = row
+        response = _Response(json.loads(value), len(value), fresh_until, stale_until)
+        self._remember(key, response)
+        return response
+
+    async def _fetch(self, endpoint: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        value = await fetch()
+
+        serialized = json.dumps(value, separators=(",", ":"))
+        now = time.time()
+        fresh_until = now + self.ttls[endpoint]
+        response = _Response(value, len(serialized), fresh_until, fresh_until + self.stale_ttl)
+        self._remember(key, response)
+        if self._db is not None:
+            await asyncio.to_thread(self._disk_set, key, serialized, response)
+
+        return value
+
+    def _refresh(self, endpoint: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+
+        task = asyncio.ensure_future(self._fetch(endpoint, key, fetch))
+        self._refreshing[key] = task
+
+        def done(task: "asyncio.Task[Any]") -> None:
+            del self._refreshing[key]
+            if not task.cancelled() and task.exception() is not None:
+                log.debug("Failed to refresh %s", key, exc_info=task.exception())
+
+        task.add_done_callback(done)
+
+    async def get_or_fetch(self, endpoint: str, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns the cached response for the key, calling fetch to get it if needed."""
+        response = await self._lookup(key)
+        now = time.time()
+
+        if response is not None and now < response.fresh_until:
+            self.hits += 1
+            return response.value
+
+        if response is not None and now < response.stale_until:
+            self.stale_hits += 1
+            self._refresh(endpoint, key, fetch)
+            return response.value
+
+        self.misses += 1
+        return await self._fetch(endpoint, key, fetch)
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .cache import ResponseCache
+from .errors import WikiUnavailable
+from .metrics import HTTP_ERRORS, HTTP_RESPONSES
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows ``rate`` operations per second on average with bursts of up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        self._refill()
+        while self._tokens < 1:
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+            self._refill()
+        self._tokens -= 1
+
+
+class CircuitBreaker:
+    """Stops sending requests to a host after ``threshold`` consecutive failures.
+
+    Once ``cooldown`` seconds pass, a single trial request is let through:
+    if it succeeds the circuit closes again, otherwise it stays open.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._trial_running or time.monotonic() - self._opened_at < self.cooldown:
+            return False
+
+        self._trial_running = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def abort_trial(self) -> None:
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.failures >= self.threshold:
+            self._opened_at = time.monotonic()
+
+
+class _HostState:
+    def __init__(self, client: "WikiClient"):
+        self.semaphore = asyncio.Semaphore(client.connections_per_host)
+        self.bucket = TokenBucket(client.requests_per_second, client.burst)
+        self.breaker = CircuitBreaker(client.breaker_threshold, client.breaker_cooldown)
+
+
+class _Retry(Exception):
+    def __init__(self, reason: str, delay: Optional[float] = None):
+        self.reason = reason
+        self.delay = delay
+
+
+class WikiClient:
+    """HTTP layer shared by all Wiki objects.
+
+    Keeps every wiki host within its own connection limit and request rate,
+    retries rate-limited and failed requests with jittered exponential backoff
+    and stops talking to hosts that keep failing for a while.
+
+    Identical requests made while one is already in flight are not sent again,
+    the callers share the result of the first one instead. Responses of the
+    endpoints configured in the cache are reused until they expire. This means
+    that the returned data must be treated as read-only.
+    """
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        *,
+        connections_per_host: int = 4,
+        requests_per_second: float = 5,
+        burst: int = 10,
+        timeout: float = 10,
+        retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8,
+        maxlag: Optional[int] = 5,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30,
+        cache: Optional[ResponseCache] = None
+    ):
+        self.session = session
+        self.cache = cache
+        self.connections_per_host = connections_per_host
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.maxlag = maxlag
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+
+        self._hosts: Dict[str, _HostState] = {}
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+
+        self.requests = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_config(cls, session: aiohttp.ClientSession, config, cache: Optional[ResponseCache] = None) -> "WikiClient":
+        return cls(session, cache=cache, **dict(config))
+
+    def _host(self, url: str) -> _HostState:
+        host = urlsplit(url).netloc
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self)
+        return state
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(resp: aiohttp.ClientResponse) -> Optional[float]:
+        value = resp.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            # HTTP-date form is not used by MediaWiki
+            return None
+
+    async def _request(self, url: str, params: Dict[str, Any]) -> Any:
+        async with self.session.get(url, params=params, timeout=self.timeout) as resp:
+            HTTP_RESPONSES.inc(urlsplit(url).hostname or "", str(resp.status))
+            if resp.status in self.RETRY_STATUSES:
+                raise _Retry(f"HTTP {resp.status}", self._retry_after(resp))
+
+            data = await resp.json()
+            if isinstance(data, dict) and data.get("error", {}).get("code") == "maxlag":
+                raise _Retry("maxlag", self._retry_after(resp) or 5)
+
+            return data
+
+    @staticmethod
+    def _request_key(url: str, params: Dict[str, Any]) -> Tuple[str, str, Tuple[Tuple[str, str], ...]]:
+        parts = urlsplit(url)
+        return (
+            parts.netloc.lower(),
+            parts.path,
+            tuple(sorted((str(key), str(value)) for key, value in params.items()))
+        )
+
+    def _forget(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Every caller might have been cancelled, do not let the error go unnoticed
+        if not task.cancelled():
+            task.exception()
+
+    async def get_json(self, url: str, params: Dict[str, Any], *, endpoint: Optional[str] = None) -> Any:
+        """Sends a GET request and decodes the JSON response.
+
+        ``endpoint`` names the API method being called. It is used to look up
+        how long the response may be cached, if at all.
+
+        Concurrent calls with the same URL and params share a single request.
+        Cancelling one of the callers does not cancel the request for the others.
+
+        Raises WikiUnavailable if the host is considered down or the request
+        still fails after all retries. Errors that are not worth retrying,
+        like a non-JSON response, are raised as is.
+        """
+        if self.cache is not None and self.cache.caches(endpoint):
+            key = json.dumps(self._request_key(url, params))
+            return await self.cache.get_or_fetch(
+                endpoint,  # type: ignore  # checked by caches()
+                key,
+                lambda: self._get_coalesced(url, params)
+            )
+
+        return await self._get_coalesced(url, params)
+
+    async def _get_coalesced(self, url: str, params: Dict[str, Any]) -> Any:
+        self.requests += 1
+        key = self._request_key(url, params)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._get_json(url, dict(params)))
+            self._inflight[key] = task
+            task.add_done_callback(lambda task: self._forget(key, task))
+
+        return await asyncio.shield(task)
+
+    async def _get_json(self, url: str, params: Dict[str, Any]) -> Any:
+        state = self._host(url)
+        if not state.breaker.allow():
+            raise WikiUnavailable(urlsplit(url).netloc)
+
+        try:
+            for attempt in range(self.retries + 1):
+                await state.bucket.acquire()
+                try:
+                    async with state.semaphore:
+                        data = await self._request(url, params)
+                except _Retry as exc:
+                    reason, delay = exc.reason, exc.delay
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as exc:
+                    reason, delay = type(exc).__name__, None
+                    HTTP_ERRORS.inc(urlsplit(url).hostname or "", reason)
+                except Exception:
+                    # The host did respond, it just was not what we expected
+                    state.breaker.record_success()
+                    raise
+                else:
+                    state.breaker.record_success()
+                    return data
+
+                if attempt == self.retries:
+                    break
+                if delay is not None and delay > self.backoff_max:
+                    # Nobody waits that long for a command, the host is as good as down
+                    reason = f"{reason}, asked to retry in {delay:.0f}s"
+                    break
+
+                delay = max(delay or 0, self._backoff(attempt))
+                log.debug("Retrying %s in %.2fs (%s)", url, delay, reason)
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            state.breaker.abort_trial()
+            raise
+
+        state.breaker.record_failure()
+        log.warning("Giving up on %s after %d attempts (%s)", url, attempt + 1, reason)
+        raise WikiUnavailable(urlsplit(url).netloc)
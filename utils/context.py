@@ -16,11 +16,7 @@ class WhiteContext(commands.Context):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.guild:
-            self.settings = GuildSettings(
-                id=self.guild.id,
-                prefix=self.bot.prefixes[self.guild.id],
-                bot=self.bot
-            )
+            self.settings = GuildSettings.for_guild(self.bot, self.guild.id)
         else:
             self.settings = None
 
@@ -30,4 +26,4 @@ class WhiteContext(commands.Context):
             raise commands.CommandError("Settings only exist on guilds.")
 
         # if guild is not None, settings are set
-        return Wiki(url=self.settings.bound_wiki_url, session=self.bot.session) # type: ignore
+        return Wiki(url=self.settings.bound_wiki_url, client=self.bot.wiki_client) # type: ignore
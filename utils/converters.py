@@ -1,48 +1,87 @@
+import asyncio
 import re
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
-import aiohttp
-from bs4 import BeautifulSoup
 from discord import app_commands
 import discord
 
+from config import config
 from utils.context import WhiteContext
+from .settings import GuildSettings
 from .wiki import Wiki
 from .errors import WikiNotFound
 if TYPE_CHECKING:
     from bot import Bot
 
+WIKI_CHOICES_LIMIT = 10
+SUGGESTIONS_LIMIT = 10
+# Discord rejects the whole autocomplete response if any choice name or value is longer
+CHOICE_MAX_LENGTH = 100
+
+
+def _time_left(interaction: discord.Interaction) -> float:
+    """Returns how long an autocomplete handler can still wait before Discord gives up on it."""
+    elapsed = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    return max(config.autocomplete.deadline - elapsed, 0.1)
+
+
+async def _guild_settings(interaction: discord.Interaction) -> Optional[GuildSettings]:
+    if interaction.guild_id is None:
+        return None
+
+    settings = GuildSettings.for_guild(interaction.client, interaction.guild_id)  # type: ignore
+    try:
+        await asyncio.wait_for(settings.query_wiki_info(), _time_left(interaction))
+    except asyncio.TimeoutError:
+        return None
+
+    return settings
+
+
 class WikiConverter(app_commands.Transformer):
     @classmethod
     async def autocomplete(cls, interaction: discord.Interaction, value: str):
-        ctx = await WhiteContext.from_interaction(interaction)
+        bot: "Bot" = interaction.client  # type: ignore
         if value == "":
-            if ctx.settings is None:
+            settings = await _guild_settings(interaction)
+            if settings is None:
                 return []
 
-            await ctx.settings.query_wiki_info()
+            # A cut URL would point to another wiki, a Fandom wiki can be given by its short name instead
+            bound_wiki = settings.bound_wiki_url  # type: ignore  # information queried
+            if len(bound_wiki) > CHOICE_MAX_LENGTH:
+                bound_wiki = Wiki(url=bound_wiki).dot_notation
+                if bound_wiki is None or len(bound_wiki) > CHOICE_MAX_LENGTH:
+                    return []
+
             return [
-                app_commands.Choice(name=ctx.settings.bound_wiki_name, value=ctx.settings.bound_wiki_url) # type: ignore  # information queried
+                app_commands.Choice(
+                    name=settings.bound_wiki_name[:CHOICE_MAX_LENGTH],  # type: ignore
+                    value=bound_wiki
+                )
             ]
         
-        async with ctx.bot.session.get(
-            "https://community.fandom.com/wiki/Special:NewWikis",
-            params=dict(start=value, limit=5)
-        ) as resp:
-            text = await resp.text()
+        entries = bot.wiki_directory.search(value, limit=WIKI_CHOICES_LIMIT)
+        if not entries:
+            # It still might be a valid wiki we have never seen. Text too long for a choice
+            # is not offered, it is still submitted as typed
+            if len(value) > CHOICE_MAX_LENGTH:
+                return []
+            return [app_commands.Choice(name=value, value=value)]
 
-        soup = BeautifulSoup(text, "html.parser")
         return [
-            app_commands.Choice(name=element.text, value=element.get("href"))
-            for element in soup.select(".mw-spcontent ul li a")
+            app_commands.Choice(name=entry.name[:CHOICE_MAX_LENGTH], value=entry.url)
+            for entry in entries
+            # A cut URL would point to another wiki
+            if len(entry.url) <= CHOICE_MAX_LENGTH
         ]
 
     @classmethod
     def common_convert(cls, bot: "Bot", argument: str) -> Wiki:
         if re.match(r"https?:\/\/", argument):
-            return Wiki(url=argument, session=bot.session)
+            return Wiki(url=argument, client=bot.wiki_client)
 
-        return Wiki.from_dot_notation(argument, session=bot.session)
+        return Wiki.from_dot_notation(argument, client=bot.wiki_client)
 
     @classmethod
     async def convert(cls, ctx: WhiteContext, argument: str) -> Wiki:
@@ -56,30 +95,41 @@ class WikiConverter(app_commands.Transformer):
 class PageConverter(app_commands.Transformer):
     @classmethod
     async def autocomplete(cls, interaction: discord.Interaction, argument: str):
-        ctx = await WhiteContext.from_interaction(interaction)
+        bot: "Bot" = interaction.client  # type: ignore
         
         if interaction.namespace.wiki:
-            wiki = await WikiConverter().convert(ctx, interaction.namespace.wiki)
+            try:
+                wiki = WikiConverter.common_convert(bot, interaction.namespace.wiki)
+            except WikiNotFound:
+                return []
         else:
-            if ctx.settings is None:
+            settings = await _guild_settings(interaction)
+            if settings is None:
                 return []
                 
-            await ctx.settings.query_wiki_info()
-            wiki = ctx.wiki
+            wiki = Wiki(url=settings.bound_wiki_url, client=bot.wiki_client)
         
-        try:
+        async def fetch():
             search = await wiki.query_nirvana(
                 controller="UnifiedSearchSuggestionsController",
                 method="getSuggestions",
                 query=argument
             )
-        except (aiohttp.ContentTypeError, aiohttp.ClientConnectorError) as exc:
-            return []
+            choices = [
+                app_commands.Choice(name=suggestion, value=suggestion)
+                for suggestion in search["suggestions"]
+                # A cut title would be another article
+                if len(suggestion) <= CHOICE_MAX_LENGTH
+            ]
+            # Complete is about what the wiki returned, not about what fits into a choice
+            return choices, len(search["suggestions"]) < SUGGESTIONS_LIMIT
 
-        return [
-            app_commands.Choice(name=suggestion, value=suggestion)
-            for suggestion in search["suggestions"]
-        ]
+        # Failed lookups are not cached, the engine answers them from what it has
+        return await bot.autocomplete.complete(
+            wiki.url, argument, fetch,  # type: ignore  # url is always set here
+            user=interaction.user.id,
+            timeout=_time_left(interaction)
+        )
 
     @classmethod
     async def convert(cls, ctx, argument):
@@ -0,0 +1,171 @@
+import asyncio
+import bisect
+import logging
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from bs4 import BeautifulSoup
+
+from .wiki import Wiki
+if TYPE_CHECKING:
+    from bot import Bot
+
+log = logging.getLogger(__name__)
+
+NEW_WIKIS_URL = "https://community.fandom.com/wiki/Special:NewWikis"
+
+
+class WikiEntry(NamedTuple):
+    name: str
+    url: str
+    dot_notation: Optional[str]
+
+
+def _parse_new_wikis(text: str) -> List[Tuple[str, str]]:
+    soup = BeautifulSoup(text, "html.parser")
+    return [
+        (element.text, element.get("href"))
+        for element in soup.select(".mw-spcontent ul li a")
+    ]
+
+
+class WikiDirectory:
+    """Index of the wikis the bot knows about, used to autocomplete wiki names.
+
+    It is filled from guild bindings, wikis used in commands and a periodic
+    crawl of Special:NewWikis. Searching is done in memory: prefix matches come
+    from a sorted list of names and dot notations, substring matches from a scan.
+    """
+
+    def __init__(self, bot: "Bot", *, refresh_interval: float = 3600, refresh_limit: int = 500):
+        self.bot = bot
+        self.refresh_interval = refresh_interval
+        self.refresh_limit = refresh_limit
+
+        self._entries: Dict[str, WikiEntry] = {}
+        self._keys: List[Tuple[str, str]] = []  # (casefolded name or dot notation, url)
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @classmethod
+    def from_config(cls, bot: "Bot", config) -> "WikiDirectory":
+        return cls(bot, refresh_interval=config.refresh_interval, refresh_limit=config.refresh_limit)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _add(self, name: str, url: str) -> Optional[WikiEntry]:
+        """Adds a wiki to the index, returns the new entry if it was not known before."""
+        url = url.rstrip("/")
+        entry = WikiEntry(name=name, url=url, dot_notation=Wiki(url=url).dot_notation)
+        old = self._entries.get(url)
+        if old == entry:
+            return None
+
+        if old is not None:
+            self._remove_keys(old)
+        self._entries[url] = entry
+        for key in self._entry_keys(entry):
+            bisect.insort(self._keys, (key, url))
+
+        return entry
+
+    @staticmethod
+    def _entry_keys(entry: WikiEntry) -> Set[str]:
+        keys = {entry.name.casefold()}
+        if entry.dot_notation is not None:
+            keys.add(entry.dot_notation.casefold())
+        return keys
+
+    def _remove_keys(self, entry: WikiEntry) -> None:
+        for key in self._entry_keys(entry):
+            index = bisect.bisect_left(self._keys, (key, entry.url))
+            if index < len(self._keys) and self._keys[index] == (key, entry.url):
+                del self._keys[index]
+
+    def search(self, query: str, limit: int = 25) -> List[WikiEntry]:
+        """Returns wikis whose name or dot notation starts with the query, then those containing it."""
+        query = query.casefold()
+        found: Dict[str, WikiEntry] = {}
+
+        index = bisect.bisect_left(self._keys, (query, ""))
+        while index < len(self._keys) and len(found) < limit:
+            key, url = self._keys[index]
+            if not key.startswith(query):
+                break
+            found.setdefault(url, self._entries[url])
+            index += 1
+
+        if len(found) < limit:
+            for key, url in self._keys:
+                if query in key and url not in found:
+                    found[url] = self._entries[url]
+                    if len(found) >= limit:
+                        break
+
+        return list(found.values())
+
+    async def _store(self, entries: Iterable[WikiEntry]) -> None:
+        query = """
+        INSERT INTO wh_known_wikis (url, name) VALUES ($1, $2)
+        ON CONFLICT (url) DO UPDATE
+        SET name = excluded.name, last_seen = now()
+        """
+        async with self.bot.pool.acquire() as conn:
+            await conn.executemany(query, [(entry.url, entry.name) for entry in entries])
+
+    async def load(self) -> None:
+        query = """
+        SELECT url, name FROM wh_known_wikis
+        UNION ALL
+        SELECT bound_wiki_url, coalesce(bound_wiki_name, bound_wiki_url) FROM wh_guilds
+        WHERE bound_wiki_url IS NOT NULL
+        """
+        async with self.bot.pool.acquire() as conn:
+            result = await conn.fetch(query)
+
+        for row in result:
+            self._add(row["name"], row["url"])
+
+    async def remember(self, wiki: Wiki, name: Optional[str] = None) -> None:
+        """Adds a wiki that was just used somewhere to the index."""
+        if wiki.url is None or (name is None and wiki.url.rstrip("/") in self._entries):
+            return
+
+        entry = self._add(name or wiki.dot_notation or wiki.url, wiki.url)
+        if entry is not None:
+            await self._store([entry])
+
+    async def refresh(self) -> int:
+        """Fetches the newest wikis from Fandom, returns the number of wikis added."""
+        async with self.bot.session.get(NEW_WIKIS_URL, params=dict(limit=self.refresh_limit)) as resp:
+            text = await resp.text()
+
+        # Parsing a big page takes a while, so it is kept off the event loop
+        wikis = await asyncio.to_thread(_parse_new_wikis, text)
+        added = [
+            entry
+            for name, url in wikis
+            if url and (entry := self._add(name, url)) is not None
+        ]
+        if added:
+            await self._store(added)
+
+        return len(added)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                added = await self.refresh()
+                log.info("Wiki directory refreshed, %d new wikis, %d total", added, len(self))
+            except Exception:
+                log.exception("Failed to refresh the wiki directory")
+
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
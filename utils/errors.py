@@ -12,4 +12,10 @@ class WhiteCommandException(WhiteException, commands.CommandError):
 
 @dataclass
 class MissingRequiredFlag(WhiteCommandException):
-    flag: str
\ No newline at end of file
+    flag: str
+
+class WikiUnavailable(WhiteException):
+    pass
+
+class AttachmentBudgetExceeded(WhiteException):
+    pass
@@ -2,6 +2,8 @@ from typing import Optional, Type
 
 
 class Flag:
+    __slots__ = ("value",)
+
     def __init__(self, value: int):
         self.value = value
 
@@ -16,13 +18,16 @@ class Flag:
 
 
 class GuildFlags:
+    __slots__ = ("value",)
+
     beta_info_commands_enabled = Flag(1 << 0)
     beta_new_wikilinks_enabled = Flag(1 << 1)
+    beta_verified_wikilinks_enabled = Flag(1 << 2)
 
     def __init__(self, value: int = 0):
         self.value = value
 
     def __iter__(self):
         for name, value in vars(self.__class__).items():
-            if not name.startswith("_"):
+            if isinstance(value, Flag):
                 yield name, getattr(self, name)
\ No newline at end of file
@@ -0,0 +1,339 @@
+"""
+Lightweight metrics with output in the Prometheus text format.
+
+Metrics are defined once at module level and updated from the hot paths;
+updating one is a dictionary lookup and an addition. Values that other objects
+already count, like cache hits, are read at scrape time through callbacks.
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import time
+from typing import (
+    Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+)
+
+from aiohttp import web
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Labels = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _check(self, labels: Labels) -> Labels:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return labels
+
+    def samples(self) -> Iterator[Tuple[str, Labels, str, float]]:
+        """Yields (name suffix, label values, extra label, value) for every sample."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, extra, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{_format_labels(self.labelnames, labels, extra)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        try:
+            self._values[labels] += amount
+        except KeyError:
+            self._values[self._check(labels)] = amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield "", labels, "", value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[self._check(labels)] = value
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield "", labels, "", value
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: "Histogram", labels: Labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(*self.labels, value=time.perf_counter() - self.started)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count for every bucket (non-cumulative) plus +Inf, then the sum
+        self._values: Dict[Labels, List[float]] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        values = self._values.get(labels)
+        if values is None:
+            values = self._values[self._check(labels)] = [0] * (len(self.buckets) + 2)
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def time(self, *labels: str) -> _Timer:
+        """Context manager observing how long its body took."""
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        values = self._values.get(labels)
+        return 0 if values is None else int(sum(values[:-1]))
+
+    def total(self, *labels: str) -> float:
+        values = self._values.get(labels)
+        return 0 if values is None else values[-1]
+
+    def samples(self):
+        for labels, values in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), values):
+                cumulative += count
+                yield "_bucket", labels, f'le="{_format_value(bound)}"', cumulative
+            yield "_count", labels, "", cumulative
+            yield "_sum", labels, "", values[-1]
+
+
+class CallbackMetric(Metric):
+    """Metric whose values are read from ``callback`` on every scrape.
+
+    The callback returns a mapping of label values to the current value.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Dict[Labels, float]],
+        type: str = "gauge"
+    ):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def samples(self):
+        for labels, value in self.callback().items():
+            yield "", labels, "", value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        self._metrics.pop(name, None)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))  # type: ignore
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))  # type: ignore
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))  # type: ignore
+
+    def callback(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Dict[Labels, float]],
+        type: str = "gauge"
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, labelnames, callback, type))  # type: ignore
+
+    def render(self, prefix: str = "") -> str:
+        """Returns the metrics whose names start with the prefix in the Prometheus text format."""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            if not name.startswith(prefix):
+                continue
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                log.exception("Failed to collect %s", name)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "whitespace_stage_seconds", "Time spent in the stages of handling events", ("stage",)
+)
+HTTP_RESPONSES = registry.counter(
+    "whitespace_http_responses_total", "Responses received from wikis", ("host", "status")
+)
+HTTP_ERRORS = registry.counter(
+    "whitespace_http_errors_total", "Requests to wikis that got no response", ("host", "error")
+)
+POOL_ACQUIRE_SECONDS = registry.histogram(
+    "whitespace_pool_acquire_seconds", "Time spent waiting for a database connection"
+)
+LOOP_LAG_SECONDS = registry.histogram(
+    "whitespace_loop_lag_seconds", "How late the event loop runs a callback scheduled on time"
+)
+
+
+def timed(stage: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Decorator recording how long a coroutine function takes in STAGE_SECONDS."""
+    def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(stage, value=time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class _TimedAcquire:
+    __slots__ = ("_context",)
+
+    def __init__(self, context: Any):
+        self._context = context
+
+    async def __aenter__(self) -> Any:
+        started = time.perf_counter()
+        conn = await self._context.__aenter__()
+        POOL_ACQUIRE_SECONDS.observe(value=time.perf_counter() - started)
+        return conn
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self._context.__aexit__(*exc)
+
+
+class TimedPool:
+    """Wraps an asyncpg pool, recording how long ``acquire()`` waits for a connection."""
+
+    def __init__(self, pool: Any):
+        self._pool = pool
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _TimedAcquire:
+        return _TimedAcquire(self._pool.acquire(timeout=timeout))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a sleep of ``interval`` seconds."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            LOOP_LAG_SECONDS.observe(value=max(time.perf_counter() - started - self.interval, 0))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class MetricsServer:
+    """Serves the registry at ``/metrics`` over HTTP."""
+
+    def __init__(self, host: str, port: int, registry: Registry = registry):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            charset="utf-8"
+        )
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
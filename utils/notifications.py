@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+import asyncpg
+
+if TYPE_CHECKING:
+    from bot import Bot
+
+log = logging.getLogger(__name__)
+
+
+class SettingsListener:
+    """Keeps guild settings of this process in sync with the database.
+
+    A trigger on wh_guilds sends a notification for every change; this class
+    holds a dedicated connection that listens for them and applies the changes
+    to the prefixes and the settings cache. Every process running the bot gets
+    the changes made by any other, so the caches never need to be polled.
+
+    While the settings are being loaded in bulk, notifications are held back
+    and applied once the load is done. Otherwise a change committed during the
+    load would be overwritten by the older snapshot.
+
+    Other parts of the bot can listen to their own channels on the same
+    connection with ``listen``. Notifications sent while the connection was
+    lost are gone, so the ``notifications_reconnected`` event is dispatched
+    after a reconnect for them to catch up.
+    """
+
+    CHANNEL = "wh_guilds_changed"
+
+    def __init__(self, bot: "Bot", *, reconnect_delay: float = 1, max_reconnect_delay: float = 60):
+        self.bot = bot
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self._conn: Optional[asyncpg.Connection] = None
+        self._reconnect_task: Optional["asyncio.Task[None]"] = None
+        self._closed = False
+        self._holds = 0
+        self._held: List[Dict[str, Any]] = []
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {}
+
+    async def start(self) -> None:
+        self._conn = await asyncpg.connect()
+        await self._conn.add_listener(self.CHANNEL, self._on_notification)
+        for channel in self._handlers:
+            await self._conn.add_listener(channel, self._on_notification)
+        self._conn.add_termination_listener(self._on_termination)
+
+    async def listen(self, channel: str, handler: Callable[[Dict[str, Any]], None]) -> None:
+        """Calls the handler with the decoded JSON payload of every notification on the channel."""
+        self._handlers[channel] = handler
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.add_listener(channel, self._on_notification)
+
+    async def unlisten(self, channel: str) -> None:
+        if self._handlers.pop(channel, None) is None:
+            return
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.remove_listener(channel, self._on_notification)
+
+    async def stop(self) -> None:
+        self._closed = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        if self._conn is not None and not self._conn.is_closed():
+            await self._conn.close()
+
+    def hold(self) -> None:
+        """Holds notifications back until ``release`` is called as many times."""
+        self._holds += 1
+
+    def release(self) -> None:
+        """Applies the notifications received since ``hold``, in the order they came."""
+        self._holds -= 1
+        if self._holds > 0:
+            return
+
+        held, self._held = self._held, []
+        for data in held:
+            self._apply(data)
+
+    def _on_notification(self, conn: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            log.warning("Malformed notification on %s: %r", channel, payload)
+            return
+
+        if channel != self.CHANNEL:
+            handler = self._handlers.get(channel)
+            if handler is not None:
+                try:
+                    handler(data)
+                except Exception:
+                    log.exception("Failed to handle a notification on %s", channel)
+            return
+
+        if self._holds:
+            self._held.append(data)
+        else:
+            self._apply(data)
+
+    def _apply(self, data: Dict[str, Any]) -> None:
+        if data["op"] == "DELETE":
+            self.bot.prefixes.pop(data["id"], None)
+            self.bot.settings_cache.pop(data["id"])
+        else:
+            self.bot.remember_guilds([data["row"]])
+
+    def _on_termination(self, conn: asyncpg.Connection) -> None:
+        if self._closed or self._reconnect_task is not None:
+            return
+
+        log.warning("Lost the settings notification connection, reconnecting")
+        self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = self.reconnect_delay
+        try:
+            while not self._closed:
+                try:
+                    await self.start()
+                except (OSError, asyncpg.PostgresError) as exc:
+                    log.warning("Could not reconnect (%s), retrying in %.0fs", exc, delay)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    continue
+
+                # Whatever changed while we were disconnected was not announced
+                await self.bot.load_guild_settings()
+                self.bot.dispatch("notifications_reconnected")
+                return
+        finally:
+            self._reconnect_task = None
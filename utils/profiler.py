@@ -0,0 +1,178 @@
+"""
+Finds out what keeps the event loop busy.
+
+A background thread looks at the stack of the event loop thread every
+``sample_interval`` seconds. The stacks are aggregated in the folded format
+understood by flamegraph.pl, speedscope and most other flame graph tools.
+The same thread notices when the loop has not run its heartbeat callback for
+``block_threshold`` seconds and records what the loop was doing at that moment.
+
+Nothing is done inside the loop except for the heartbeat, and sampling costs
+one ``sys._current_frames()`` call per sample, so it can be left running.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Counter, Deque, List, NamedTuple, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class BlockedLoop(NamedTuple):
+    started: float  # time.time() of the last heartbeat before the block
+    duration: float
+    stack: List[str]
+
+
+def _is_idle(frame: FrameType) -> bool:
+    # Waiting in the selector means that there is nothing to run
+    code = frame.f_code
+    return code.co_name in ("select", "poll", "control") and os.path.basename(code.co_filename) == "selectors.py"
+
+
+def _fold(frame: Optional[FrameType]) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class LoopProfiler:
+    def __init__(
+        self,
+        *,
+        sample_interval: float = 0.05,
+        block_threshold: float = 0.1,
+        max_stacks: int = 10000,
+        history: int = 50
+    ):
+        self.sample_interval = sample_interval
+        self.block_threshold = block_threshold
+        self.max_stacks = max_stacks
+
+        self.samples: Counter[str] = collections.Counter()
+        self.idle_samples = 0
+        self.dropped_samples = 0
+        self.blocks: Deque[BlockedLoop] = collections.deque(maxlen=history)
+        self.total_blocks = 0
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._heartbeat: Optional[asyncio.TimerHandle] = None
+        self._last_beat = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @classmethod
+    def from_config(cls, config) -> "LoopProfiler":
+        return cls(
+            sample_interval=config.sample_interval,
+            block_threshold=config.block_threshold,
+            max_stacks=config.max_stacks,
+            history=config.history
+        )
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        """Starts profiling the running event loop, must be called from inside it."""
+        if self._thread is not None:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._beat()
+        self._thread = threading.Thread(target=self._run, name="loop-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples.clear()
+            self.idle_samples = 0
+            self.dropped_samples = 0
+            self.blocks.clear()
+
+    def _beat(self) -> None:
+        assert self._loop is not None
+        self._last_beat = time.monotonic()
+        # Beating more often than the threshold makes a block show up on time
+        self._heartbeat = self._loop.call_later(self.block_threshold / 2, self._beat)
+
+    def _run(self) -> None:
+        blocked_since: Optional[float] = None
+        block_stack: List[str] = []
+
+        while not self._stopped.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._loop_thread)  # type: ignore
+            if frame is None:
+                continue
+
+            now = time.monotonic()
+            last_beat = self._last_beat
+            if blocked_since is not None and last_beat != blocked_since:
+                # The loop got to the heartbeat, so the block is over
+                self._record_block(blocked_since, last_beat - blocked_since, block_stack)
+                blocked_since = None
+            if blocked_since is None and now - last_beat >= self.block_threshold:
+                blocked_since = last_beat
+                block_stack = traceback.format_stack(frame)
+
+            self._sample(frame)
+            del frame
+
+    def _sample(self, frame: FrameType) -> None:
+        with self._lock:
+            if _is_idle(frame):
+                self.idle_samples += 1
+                return
+
+            stack = _fold(frame)
+            if stack in self.samples or len(self.samples) < self.max_stacks:
+                self.samples[stack] += 1
+            else:
+                self.dropped_samples += 1
+
+    def _record_block(self, since: float, duration: float, stack: List[str]) -> None:
+        started = time.time() - (time.monotonic() - since)
+        with self._lock:
+            self.blocks.append(BlockedLoop(started, duration, stack))
+            self.total_blocks += 1
+        log.warning(
+            "The event loop was blocked for %.0f ms, it was running:\n%s", duration * 1000, "".join(stack)
+        )
+
+    def sample_count(self) -> Tuple[int, int]:
+        """Returns the number of samples and of distinct stacks collected."""
+        with self._lock:
+            return sum(self.samples.values()), len(self.samples)
+
+    def folded(self) -> str:
+        """Returns the collected samples in the folded stacks format."""
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,135 @@
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple, TypedDict
+
+import asyncpg
+
+from .flags import GuildFlags
+from .metrics import timed
+
+
+class GuildRow(TypedDict):
+    id: int
+    prefix: str
+    bound_wiki_url: Optional[str]
+    bound_wiki_name: Optional[str]
+    flags: int
+
+
+COLUMNS: Tuple[str, ...] = ("id", "prefix", "bound_wiki_url", "bound_wiki_name", "flags")
+EDITABLE_COLUMNS: Tuple[str, ...] = COLUMNS[1:]
+COLUMN_SET = frozenset(COLUMNS)
+EDITABLE_COLUMN_SET = frozenset(EDITABLE_COLUMNS)
+
+_SELECT = ", ".join(COLUMNS)
+_TYPES = {"id": "bigint", "prefix": "text", "bound_wiki_url": "text", "bound_wiki_name": "text", "flags": "bigint"}
+
+
+def _update_query() -> str:
+    # Every editable column comes with a boolean telling whether it should be
+    # changed, so that any combination of columns goes through the same statement
+    params = ["$1::bigint[]"]
+    names = ["id"]
+    assignments = []
+    for index, column in enumerate(EDITABLE_COLUMNS):
+        params += [f"${index * 2 + 2}::boolean[]", f"${index * 2 + 3}::{_TYPES[column]}[]"]
+        names += [f"set_{column}", column]
+        assignments.append(f"{column} = CASE WHEN u.set_{column} THEN u.{column} ELSE g.{column} END")
+
+    return f"""
+    UPDATE wh_guilds AS g SET {", ".join(assignments)}
+    FROM unnest({", ".join(params)}) AS u({", ".join(names)})
+    WHERE g.id = u.id
+    RETURNING {", ".join("g." + column for column in COLUMNS)}
+    """
+
+
+class GuildRepository:
+    """Reads and writes wh_guilds through a fixed set of statements.
+
+    The query text never depends on the arguments, so asyncpg's statement
+    cache keeps every statement prepared on each connection and Postgres
+    only parses and plans them once. Single-guild calls are just batches of one.
+    """
+
+    FETCH_ALL = f"SELECT {_SELECT} FROM wh_guilds"
+    FETCH_MANY = f"SELECT {_SELECT} FROM wh_guilds WHERE id = ANY($1::bigint[])"
+    CREATE_MANY = f"""
+    INSERT INTO wh_guilds (id) SELECT unnest($1::bigint[])
+    ON CONFLICT (id) DO NOTHING
+    RETURNING {_SELECT}
+    """
+    # Unlike CREATE_MANY, returns the existing rows as well
+    ENSURE_MANY = f"""
+    INSERT INTO wh_guilds (id) SELECT unnest($1::bigint[])
+    ON CONFLICT (id) DO UPDATE SET id = excluded.id
+    RETURNING {_SELECT}
+    """
+    UPDATE_MANY = _update_query()
+
+    def __init__(self, pool: asyncpg.Pool):
+        self.pool = pool
+
+    @staticmethod
+    def _row(record: asyncpg.Record) -> GuildRow:
+        return dict(record)  # type: ignore
+
+    @staticmethod
+    def validate(columns: Iterable[str], *, editable: bool = False) -> None:
+        allowed = EDITABLE_COLUMN_SET if editable else COLUMN_SET
+        for column in columns:
+            if column not in allowed:
+                raise ValueError("Invalid parameter passed: " + column)
+
+    @timed("db.guilds")
+    async def _fetch(self, query: str, *args: Any) -> List[GuildRow]:
+        async with self.pool.acquire() as conn:
+            records = await conn.fetch(query, *args)
+        return [self._row(record) for record in records]
+
+    async def fetch_all(self) -> List[GuildRow]:
+        return await self._fetch(self.FETCH_ALL)
+
+    async def fetch_many(self, guild_ids: Iterable[int]) -> Dict[int, GuildRow]:
+        rows = await self._fetch(self.FETCH_MANY, list(guild_ids))
+        return {row["id"]: row for row in rows}
+
+    async def fetch(self, guild_id: int) -> Optional[GuildRow]:
+        return (await self.fetch_many([guild_id])).get(guild_id)
+
+    async def create_many(self, guild_ids: Iterable[int]) -> List[GuildRow]:
+        """Creates default settings for the guilds that have none, returns the created rows."""
+        return await self._fetch(self.CREATE_MANY, list(guild_ids))
+
+    async def ensure(self, guild_id: int) -> GuildRow:
+        """Returns the settings of the guild, creating them if needed."""
+        rows = await self._fetch(self.ENSURE_MANY, [guild_id])
+        return rows[0]
+
+    async def update_many(self, changes: Mapping[int, Mapping[str, Any]]) -> Dict[int, GuildRow]:
+        """Applies the changes, keyed by guild id, and returns the updated rows.
+
+        Guilds may change different columns; the ones not mentioned are kept.
+        Flags can be passed either as GuildFlags or as integers.
+        """
+        for values in changes.values():
+            self.validate(values, editable=True)
+
+        ids = list(changes)
+        args: List[List[Any]] = [ids]
+        for column in EDITABLE_COLUMNS:
+            mask = [column in changes[guild_id] for guild_id in ids]
+            column_values = []
+            for guild_id in ids:
+                value = changes[guild_id].get(column)
+                if isinstance(value, GuildFlags):
+                    value = value.value
+                column_values.append(value)
+            args += [mask, column_values]
+
+        rows = await self._fetch(self.UPDATE_MANY, *args)
+        return {row["id"]: row for row in rows}
+
+    async def update(self, guild_id: int, **values: Any) -> Optional[GuildRow]:
+        """Changes the given columns of one guild, returns None if it has no settings."""
+        if not values:
+            raise ValueError("No values passed")
+        return (await self.update_many({guild_id: values})).get(guild_id)
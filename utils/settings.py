@@ -1,11 +1,18 @@
-from dataclasses import asdict, dataclass, InitVar
-from typing import Optional
+from dataclasses import dataclass, field, InitVar
+from typing import Any, Dict, Optional
 
 from discord.ext import commands
 
+from config import config
+from .cache import TTLCache
 from .flags import GuildFlags
+from .repository import GuildRepository, GuildRow
 
-@dataclass
+# Rows of wh_guilds keyed by guild id. Flags are kept as plain integers so
+# that in-place edits of a GuildFlags object never leak into the cache.
+SettingsCache = TTLCache[int, GuildRow]
+
+@dataclass(slots=True)
 class GuildSettings:
     id: int
     prefix: str
@@ -17,68 +24,66 @@ class GuildSettings:
 
     flags: Optional[GuildFlags] = None
 
+    # One of these is created for every message, so they are slotted
+    _bot: commands.Bot = field(init=False, repr=False, compare=False)
+    _repository: GuildRepository = field(init=False, repr=False, compare=False)
+    _cache: SettingsCache = field(init=False, repr=False, compare=False)
+
     def __post_init__(self, bot):
         self._bot = bot
-        self._pool = bot.pool
+        self._repository = bot.guild_repository
+        self._cache = bot.settings_cache
+
+    @classmethod
+    def for_guild(cls, bot: commands.Bot, guild_id: int) -> "GuildSettings":
+        prefix = bot.prefixes.get(guild_id, config.default_prefix)  # type: ignore
+        return cls(id=guild_id, prefix=prefix, bot=bot)
+
+    def _apply(self, row: GuildRow, fields) -> Dict[str, Any]:
+        result = {}
+        for field in fields:
+            value = row[field]
+            result[field] = value
+            if field == "flags":
+                value = GuildFlags(value)
+            setattr(self, field, value)
+        
+        return result
 
     async def query_wiki_info(self, force=False):
         wiki_attrs = ["bound_wiki_url", "bound_wiki_name"]
 
         if not force:
-            for attr in wiki_attrs:
-                if getattr(self, attr):
-                    wiki_attrs.remove(attr)
+            wiki_attrs = [attr for attr in wiki_attrs if not getattr(self, attr)]
 
         if len(wiki_attrs) > 0:
-            return await self.query(*wiki_attrs)
-
-    async def query(self, *args):
-        if not args:
-            to_select = "*"
-        else:
-            fields = asdict(self).keys()
-            for field in args:
-                if field not in fields:
-                    raise ValueError("Invalid parameter passed: " + field)
-
-            to_select = ", ".join(args)
-
-        query = f"SELECT {to_select} FROM wh_guilds WHERE id=$1"
-        async with self._pool.acquire() as conn:
-            result = await conn.fetchrow(query, self.id)
-        
-        for field, value in result.items():
-            if field == "flags":
-                value = GuildFlags(value)
-            setattr(self, field, value)
-        
-        return result
+            return await self.query(*wiki_attrs, force=force)
 
-    async def update(self, **kwargs):
-        if not kwargs:
-            raise ValueError("No values passed")
-        
-        query = "UPDATE wh_guilds SET "
-        fields = asdict(self).keys()
-        for idx, field in enumerate(kwargs.keys()):
-            if field not in fields:
-                raise ValueError("Invalid parameter passed: " + field)
+    async def query(self, *args, force=False):
+        GuildRepository.validate(args)
 
-            query += f"{field}=${idx + 1} "
-        query += f"WHERE id=${len(kwargs) + 1}"
+        if not force:
+            row = self._cache.get(self.id)
+            if row is not None:
+                return self._apply(row, args or row.keys())
 
-        if "flags" in kwargs:
-            kwargs["flags"] = kwargs["flags"].value
+        row = await self._repository.fetch(self.id)
+        if row is None:
+            # The bot joined the guild while it was offline and it has not been reconciled yet
+            row = await self._repository.ensure(self.id)
+            self._bot.prefixes[self.id] = row["prefix"]
 
-        async with self._pool.acquire() as conn:
-            result = await conn.execute(query, *kwargs.values(), self.id)
+        self._cache.set(self.id, row)
+        return self._apply(row, args or row.keys())
 
-        for field, value in kwargs.items():
-            if field == "prefix":
-                self._bot.prefixes[self.id] = value
-            elif field == "flags":
-                value = GuildFlags(value)
-                
-            setattr(self, field, value)
+    async def update(self, **kwargs):
+        row = await self._repository.update(self.id, **kwargs)
+        if row is None:
+            raise ValueError(f"Guild {self.id} has no settings")
+
+        # Write through, so that the next query does not have to hit the database
+        self._cache.set(self.id, row)
+        if "prefix" in kwargs:
+            self._bot.prefixes[self.id] = row["prefix"]
 
-        return result
\ No newline at end of file
+        self._apply(row, kwargs.keys())
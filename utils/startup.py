@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, Awaitable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class Phase(NamedTuple):
+    name: str
+    offset: float  # seconds since the startup began
+    duration: float
+
+
+class StartupTimer:
+    """Measures the phases of the bot's startup and logs a breakdown once it is finished.
+
+    Phases may overlap: independent steps run at the same time through ``gather``,
+    and the offsets in the report show which ones did.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Phase] = []
+        self.finished_at: Optional[float] = None
+
+    def record(self, name: str, started: float) -> None:
+        now = time.perf_counter()
+        self.phases.append(Phase(name, started - self.started, now - started))
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    async def run(self, name: str, aw: Awaitable[Any]) -> Any:
+        with self.phase(name):
+            return await aw
+
+    async def gather(self, *steps: Tuple[str, Awaitable[Any]]) -> List[Any]:
+        """Runs the steps concurrently, each one timed as a phase of its own.
+
+        If a step fails, the others are cancelled and the error is raised once
+        they have stopped, so nothing keeps starting up behind a failed startup.
+        """
+        tasks = [asyncio.ensure_future(self.run(name, aw)) for name, aw in steps]
+        if not tasks:
+            return []
+
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        except asyncio.CancelledError:
+            await self._cancel(tasks)
+            raise
+
+        failed = next((task for task in tasks if task in done and task.exception() is not None), None)
+        if failed is not None:
+            await self._cancel(pending)
+            raise failed.exception()  # type: ignore
+
+        return [task.result() for task in tasks]
+
+    @staticmethod
+    async def _cancel(tasks: Iterable["asyncio.Future[Any]"]) -> None:
+        tasks = list(tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def durations(self) -> Dict[str, float]:
+        return {phase.name: phase.duration for phase in self.phases}
+
+    def report(self) -> str:
+        width = max((len(phase.name) for phase in self.phases), default=0)
+        total = (self.finished_at or time.perf_counter()) - self.started
+        lines = [f"Startup took {total * 1000:.0f} ms{'' if self.finished else ' so far'}:"]
+        for phase in sorted(self.phases, key=lambda phase: phase.offset):
+            lines.append(
+                f"  {phase.name:<{width}}  {phase.duration * 1000:7.1f} ms, from {phase.offset * 1000:.0f} ms"
+            )
+        return "\n".join(lines)
+
+    def finish(self) -> None:
+        if self.finished:
+            return
+        self.finished_at = time.perf_counter()
+        log.info(self.report())
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple
+
+import discord
+
+if TYPE_CHECKING:
+    from bot import Bot
+
+log = logging.getLogger(__name__)
+
+# Stored in place of a guild id for the global commands
+GLOBAL_SCOPE = 0
+
+Payload = List[Dict[str, Any]]
+
+
+def _key(command: Dict[str, Any]) -> Tuple[int, str]:
+    return command.get("type", 1), command["name"]
+
+
+def _hash(payload: Payload) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class ScopeDiff(NamedTuple):
+    guild_id: int  # GLOBAL_SCOPE for the global commands
+    hash: str
+    payload: Payload
+    added: List[str]
+    removed: List[str]
+    changed: List[str]  # command names, followed by the fields that differ
+    known: bool = True  # whether the scope was synced before
+
+    @property
+    def unchanged(self) -> bool:
+        return self.known and not (self.added or self.removed or self.changed)
+
+    def describe(self) -> str:
+        scope = "global" if self.guild_id == GLOBAL_SCOPE else f"guild {self.guild_id}"
+        if self.unchanged:
+            return f"{scope}: unchanged"
+        lines = [f"{scope}:" if self.known else f"{scope}, not synced before:"]
+        lines.extend(f"  + {name}" for name in self.added)
+        lines.extend(f"  - {name}" for name in self.removed)
+        lines.extend(f"  ~ {name}" for name in self.changed)
+        return "\n".join(lines)
+
+
+class CommandSync:
+    """Syncs application commands only for the scopes whose definitions have changed.
+
+    The payload of every scope is hashed and compared with the one stored in
+    wh_command_sync after the last sync, so a deploy that does not touch the
+    commands makes no calls to Discord. The stored payload is used to tell
+    what exactly is about to change.
+    """
+
+    def __init__(self, bot: "Bot"):
+        self.bot = bot
+
+    def scopes(self) -> List[int]:
+        """Returns the guilds to sync, with the global commands copied to each, or only the global scope."""
+        if not self.bot.guild_ids:
+            return [GLOBAL_SCOPE]
+
+        for guild_id in self.bot.guild_ids:
+            self.bot.tree.copy_global_to(guild=discord.Object(guild_id))
+        return list(self.bot.guild_ids)
+
+    def payload(self, guild_id: int) -> Payload:
+        guild = None if guild_id == GLOBAL_SCOPE else discord.Object(guild_id)
+        commands = [command.to_dict() for command in self.bot.tree.get_commands(guild=guild)]
+        return sorted(commands, key=_key)
+
+    async def _stored(self, application_id: int) -> Dict[int, Tuple[str, Payload]]:
+        query = "SELECT guild_id, hash, payload FROM wh_command_sync WHERE application_id=$1"
+        async with self.bot.pool.acquire() as conn:
+            rows = await conn.fetch(query, application_id)
+        return {row["guild_id"]: (row["hash"], json.loads(row["payload"])) for row in rows}
+
+    async def _store(self, application_id: int, diff: ScopeDiff) -> None:
+        query = """
+        INSERT INTO wh_command_sync (application_id, guild_id, hash, payload) VALUES ($1, $2, $3, $4::jsonb)
+        ON CONFLICT (application_id, guild_id) DO UPDATE
+        SET hash = excluded.hash, payload = excluded.payload, synced_at = now()
+        """
+        async with self.bot.pool.acquire() as conn:
+            await conn.execute(query, application_id, diff.guild_id, diff.hash, json.dumps(diff.payload))
+
+    @staticmethod
+    def diff(guild_id: int, payload: Payload, stored: Optional[Tuple[str, Payload]]) -> ScopeDiff:
+        digest = _hash(payload)
+        new = {_key(command): command for command in payload}
+        if stored is None:
+            # Nothing is known about what Discord has, so everything counts as new
+            return ScopeDiff(guild_id, digest, payload, [name for _, name in new], [], [], known=False)
+
+        stored_hash, stored_payload = stored
+        if stored_hash == digest:
+            return ScopeDiff(guild_id, digest, payload, [], [], [])
+
+        old = {_key(command): command for command in stored_payload}
+        changed = []
+        for key in new.keys() & old.keys():
+            fields = sorted(
+                field for field in new[key].keys() | old[key].keys()
+                if new[key].get(field) != old[key].get(field)
+            )
+            if fields:
+                changed.append(f"{key[1]} ({', '.join(fields)})")
+
+        return ScopeDiff(
+            guild_id,
+            digest,
+            payload,
+            added=sorted(name for _, name in new.keys() - old.keys()),
+            removed=sorted(name for _, name in old.keys() - new.keys()),
+            changed=sorted(changed)
+        )
+
+    async def plan(self, *, force: bool = False) -> List[ScopeDiff]:
+        """Compares the current commands with what was synced last, scope by scope."""
+        application_id = self.bot.application_id
+        assert application_id is not None
+        stored = {} if force else await self._stored(application_id)
+        return [self.diff(guild_id, self.payload(guild_id), stored.get(guild_id)) for guild_id in self.scopes()]
+
+    async def sync(self, *, dry_run: bool = False, force: bool = False) -> List[ScopeDiff]:
+        """Syncs the scopes that have changed, returns the differences found.
+
+        With ``force``, the stored hashes are ignored and every scope is synced,
+        which repairs commands changed on Discord's side by someone else.
+        """
+        application_id = self.bot.application_id
+        assert application_id is not None
+        diffs = await self.plan(force=force)
+        if dry_run:
+            return diffs
+
+        for diff in diffs:
+            if diff.unchanged:
+                continue
+            guild = None if diff.guild_id == GLOBAL_SCOPE else discord.Object(diff.guild_id)
+            await self.bot.tree.sync(guild=guild)
+            # Only remembered once Discord has accepted it, a failed sync is retried next time
+            await self._store(application_id, diff)
+
+        synced = sum(not diff.unchanged for diff in diffs)
+        log.info("Synced application commands of %d out of %d scopes", synced, len(diffs))
+        return diffs
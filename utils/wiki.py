@@ -1,24 +1,37 @@
-from typing import Any, Optional
+import asyncio
+import re
+from typing import TYPE_CHECKING, Any, Dict, Iterable, NamedTuple, Optional
 from urllib.parse import urlencode
 
-import aiohttp
-
 from utils.errors import WikiNotFound
+from utils.metrics import timed
+if TYPE_CHECKING:
+    from utils.client import WikiClient
+
+# MediaWiki does not accept more titles in one request from regular users
+MAX_TITLES_PER_QUERY = 50
+
+FANDOM_URL_REGEX = re.compile(r"https?://([a-z0-9-]+)\.fandom\.com(?:/([a-z-]+))?/?$", re.IGNORECASE)
+
+class PageInfo(NamedTuple):
+    title: str
+    exists: bool
+    redirected: bool = False
 
 class Wiki:
-    def __init__(self, url: Optional[str] = None, id: Optional[int] = None, *, session: Optional[aiohttp.ClientSession] = None):
+    def __init__(self, url: Optional[str] = None, id: Optional[int] = None, *, client: Optional["WikiClient"] = None):
         if (url is None) and (id is None):
             raise ValueError("You must specify at least one of: id, url")
 
         self.id = id
-        self._session = session
+        self._client = client
 
         if url is not None and url.endswith("/"):
             url = url[:-1]
         self.url = url
 
     @classmethod
-    def from_dot_notation(cls, name: str, session: Optional[aiohttp.ClientSession] = None):
+    def from_dot_notation(cls, name: str, client: Optional["WikiClient"] = None):
         name_parts = name.split(".")
         if len(name_parts) == 1:
             wiki_url = f"https://{name_parts[0]}.fandom.com"
@@ -27,7 +40,17 @@ class Wiki:
         else:
             raise WikiNotFound
         
-        return cls(url=wiki_url, session=session)
+        return cls(url=wiki_url, client=client)
+
+    @property
+    def dot_notation(self) -> Optional[str]:
+        """Returns the short name of a Fandom wiki, e.g. ``ru.community``, if it has one"""
+
+        if not self.url or not (match := FANDOM_URL_REGEX.match(self.url)):
+            return None
+
+        subdomain, lang = match.groups()
+        return f"{lang}.{subdomain}" if lang else subdomain
 
     def url_to(self, page: str, **params) -> str:
         """Returns URL to the given page"""
@@ -53,13 +76,14 @@ class Wiki:
         
         return f"{self.url}/?{urlencode(params)}"
     
+    @timed("wiki.query")
     async def query(self, **params) -> dict[str, Any]:
         """Queries MediaWiki api with given params"""
 
         if not self.url:
             raise RuntimeError("Wiki url is required to do this")
-        if self._session is None:
-            raise RuntimeError("This object does not have a session attached to it")
+        if self._client is None:
+            raise RuntimeError("This object does not have a client attached to it")
         
         for key, value in params.items():
             if isinstance(value, bool):
@@ -67,17 +91,56 @@ class Wiki:
 
         params["action"] = "query"
         params["format"] = "json"
-        async with self._session.get(self.url + "/api.php", params=params) as resp:
-            return await resp.json()
+        if self._client.maxlag is not None:
+            params.setdefault("maxlag", self._client.maxlag)
+        endpoint = "query." + str(params.get("list") or params.get("prop") or params.get("meta") or "titles")
+        return await self._client.get_json(self.url + "/api.php", params, endpoint=endpoint)
     
+    @timed("wiki.query_nirvana")
     async def query_nirvana(self, **params) -> dict[str, Any]:
         """Queries Nirvana with given params"""
 
         if not self.url:
             raise RuntimeError("Wiki url is required to do this")
-        if self._session is None:
-            raise RuntimeError("This object does not have a session attached to it")
+        if self._client is None:
+            raise RuntimeError("This object does not have a client attached to it")
         
         params["format"] = "json"
-        async with self._session.get(self.url + "/wikia.php", params=params) as resp:
-            return await resp.json()
+        endpoint = f"{params.get('controller')}.{params.get('method')}"
+        return await self._client.get_json(self.url + "/wikia.php", params, endpoint=endpoint)
+
+    async def query_titles(self, titles: Iterable[str]) -> Dict[str, PageInfo]:
+        """Resolves the given titles, following redirects and normalizing them.
+
+        Titles are sent in batches of MAX_TITLES_PER_QUERY, the result maps each
+        of the given titles to the information about the page it points to.
+        """
+
+        titles = list(dict.fromkeys(titles))
+        chunks = [
+            titles[start:start + MAX_TITLES_PER_QUERY]
+            for start in range(0, len(titles), MAX_TITLES_PER_QUERY)
+        ]
+        responses = await asyncio.gather(*(
+            self.query(titles="|".join(chunk), redirects=True, formatversion=2)
+            for chunk in chunks
+        ))
+
+        result = {}
+        for chunk, data in zip(chunks, responses):
+            data = data.get("query", {})
+            normalized = {item["from"]: item["to"] for item in data.get("normalized", [])}
+            redirects = {item["from"]: item["to"] for item in data.get("redirects", [])}
+            pages = {page["title"]: page for page in data.get("pages", [])}
+            interwiki = {item["title"] for item in data.get("interwiki", [])}
+
+            for title in chunk:
+                name = normalized.get(title, title)
+                target = redirects.get(name, name)
+                page = pages.get(target)
+                exists = name in interwiki or (
+                    page is not None and not page.get("missing") and not page.get("invalid")
+                )
+                result[title] = PageInfo(title=target, exists=exists, redirected=target != name)
+
+        return result